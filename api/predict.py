@@ -1,11 +1,167 @@
 import json
+import logging
 import os
+import sys
+import time
 import traceback
 from http import HTTPStatus
 
-# Cached model in global so cold-start load persists across invocations when possible
+# Shared model code lives in app/ at the repository root
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+# Debug output is opt-in: LOG_LEVEL=DEBUG restores the per-request trace lines.
+log = logging.getLogger('predict')
+if not log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('[predict] %(message)s'))
+    log.addHandler(_handler)
+    log.propagate = False
+# An unknown level name must not keep the function from loading
+_LOG_LEVEL = os.environ.get('LOG_LEVEL', 'WARNING').upper()
+if not isinstance(logging.getLevelName(_LOG_LEVEL), int):
+    _LOG_LEVEL = 'WARNING'
+log.setLevel(_LOG_LEVEL)
+
+# One structured JSON line per invocation with its stage timings, outcome and
+# cold-start details, for log-based metrics. METRICS_LOG=0 turns it off.
+_METRICS_LOG = os.environ.get('METRICS_LOG', '1').lower() not in ('0', 'false', 'no', '')
+metrics_log = logging.getLogger('predict.metrics')
+if not metrics_log.handlers:
+    _metrics_handler = logging.StreamHandler(sys.stdout)
+    _metrics_handler.setFormatter(logging.Formatter('%(message)s'))
+    metrics_log.addHandler(_metrics_handler)
+    metrics_log.propagate = False
+metrics_log.setLevel(logging.INFO)
+
+# Candidate model locations in the repository, in order of preference; each
+# one's compiled .forest sibling is preferred over the joblib file itself.
+_REPO_MODEL_PATHS = [
+    os.path.join(_ROOT, 'app', 'model.joblib'),
+    os.path.join(_ROOT, 'model.joblib'),
+]
+
+_CLASS_NAMES = ('setosa', 'versicolor', 'virginica')
+
+# Module-level state, initialized once per process (i.e. once per cold start)
+# and reused by every warm invocation.
 _MODEL = None
 _MODEL_PATH = None
+_CACHE = None
+_VALIDATOR = None
+_np = None
+# Initialization timings (download_s, load_s), reported by the first
+# invocation after they were measured.
+_INIT_TIMINGS = {}
+
+
+class _InitError(Exception):
+    """Model initialization failed; carries the message returned to the caller."""
+
+
+def _download_model(model_url):
+    """
+    Fetches MODEL_URL through the download cache (app/download.py): verified
+    against MODEL_SHA256 when set, resumed if interrupted, and shared by
+    concurrent cold starts on the same host.
+    """
+    import tempfile
+    from app.download import DownloadError, fetch
+
+    # Keep the artifact format (a compiled model must be a single-file
+    # .forest.npz to download)
+    suffix = '.forest.npz' if model_url.split('?')[0].endswith('.npz') else '.joblib'
+    cache_dir = os.environ.get('MODEL_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'model-cache')
+    start = time.perf_counter()
+    try:
+        path = fetch(model_url, cache_dir, sha256=os.environ.get('MODEL_SHA256'), suffix=suffix)
+    except DownloadError as e:
+        raise _InitError(f'Failed to download model: {e}')
+    _INIT_TIMINGS['download_s'] = time.perf_counter() - start
+    log.info('Model from %s cached at %s', model_url, path)
+    return path
+
+
+def _resolve_model_path():
+    """Returns the model file to load: MODEL_URL download, else a repository file."""
+    model_url = os.environ.get('MODEL_URL')
+    if model_url:
+        return _download_model(model_url)
+
+    from app.forest import find_model
+    path = find_model(_REPO_MODEL_PATHS)
+    if path is None:
+        raise _InitError(
+            'Model not available: set MODEL_URL to a public HTTPS model URL '
+            'or include app/model.joblib in the repository.'
+        )
+    return path
+
+
+def _init_model():
+    """Loads and warms the model once; later calls are a single None check."""
+    global _MODEL, _MODEL_PATH, _CACHE, _VALIDATOR, _np
+    if _MODEL is not None:
+        return
+
+    # Heavy deps are imported here, inside error handling, so an import-time
+    # failure becomes an error response instead of crashing the function.
+    try:
+        import numpy as np
+        from app import cache as prediction_cache
+        from app.forest import artifact_fingerprint, load_model
+        from app.validation import DEFAULT_MARGIN, Validator
+    except Exception as e:
+        raise _InitError(f'Import error: {e}')
+
+    path = _resolve_model_path()
+    start = time.perf_counter()
+    try:
+        model = load_model(path)
+        # Warm-up predict: faults in the model pages and any lazy imports
+        model.predict(np.zeros((1, model.n_features_in_), dtype=np.float32))
+    except Exception as e:
+        raise _InitError(f'Failed to load model from {path}: {e}')
+    _INIT_TIMINGS['load_s'] = time.perf_counter() - start
+
+    if _CACHE is None:
+        _CACHE = prediction_cache.from_env(os.environ)
+    _CACHE.bind(artifact_fingerprint(path))
+    # The same checks as the server: finite numbers within the training
+    # ranges (from the artifact's .schema.json, when it has one)
+    _VALIDATOR = Validator.for_artifact(
+        path, float(os.environ.get('FEATURE_RANGE_MARGIN', str(DEFAULT_MARGIN))))
+
+    _np = np
+    _MODEL_PATH = path
+    _MODEL = model
+    log.info('Model loaded from %s', path)
+
+
+# Pay the initialization cost at import time, i.e. during the cold start,
+# rather than inside the first request. Failures are retried per request.
+try:
+    _init_model()
+except Exception:
+    log.warning('Model initialization deferred:\n%s', traceback.format_exc())
+
+
+def _log_invocation(stages, start, status, class_name=None):
+    """Emits the per-invocation metrics line (see METRICS_LOG)."""
+    record = {
+        'event': 'predict',
+        'status': int(status),
+        'outcome': 'ok' if status < 400 else 'client_error' if status < 500 else 'server_error',
+        'total_ms': round((time.perf_counter() - start) * 1e3, 3),
+        'stages_ms': {stage: round(seconds * 1e3, 3) for stage, seconds in stages.items()},
+    }
+    if class_name is not None:
+        record['class_name'] = class_name
+    if _INIT_TIMINGS:
+        record['cold_start'] = {k: round(v, 4) for k, v in _INIT_TIMINGS.items()}
+        _INIT_TIMINGS.clear()
+    metrics_log.info(json.dumps(record))
 
 
 # Vercel Serverless function handler
@@ -13,14 +169,23 @@ def handler(request):
     """Vercel-compatible Python serverless function.
 
     Expects a POST request with JSON payload: {"features": [f1, f2, f3, f4]}
-    Loads the joblib model from the repository and returns the predicted class.
-    This version surfaces tracebacks and prints debug information so Vercel logs
-    contain actionable diagnostics when a function invocation fails.
+    Returns the predicted class from the model (a compiled .forest artifact or
+    a joblib file) that was loaded once per process. Set LOG_LEVEL=DEBUG to
+    log each request; errors always include a traceback.
     """
-    try:
-        print("[predict] handler start")
-        print(f"[predict] REQUEST_METHOD={getattr(request, 'method', None)}")
+    start = time.perf_counter()
+    stages = {}
+    response = _handle(request, stages)
+    if _METRICS_LOG:
+        body, status = response
+        _log_invocation(stages, start, status, body.get('predicted_class'))
+    return response
 
+
+def _handle(request, stages):
+    """Scores one request, recording stage durations (seconds) in ``stages``."""
+    try:
+        mark = time.perf_counter()
         if request.method != 'POST':
             return ({'error': 'Only POST supported'}, HTTPStatus.METHOD_NOT_ALLOWED)
 
@@ -28,120 +193,47 @@ def handler(request):
             body = request.get_json() if hasattr(request, 'get_json') else json.loads(request.data)
         except Exception:
             tb = traceback.format_exc()
-            print(f"[predict] Failed to parse JSON body:\n{tb}")
+            log.warning('Failed to parse JSON body:\n%s', tb)
             return ({'error': 'Invalid JSON body', 'traceback': tb}, HTTPStatus.BAD_REQUEST)
+        now = time.perf_counter()
+        stages['parse'], mark = now - mark, now
 
-        features = body.get('features')
+        features = body.get('features') if isinstance(body, dict) else None
         if features is None:
             return ({'error': 'Missing "features" in request body'}, HTTPStatus.BAD_REQUEST)
 
-        global _MODEL, _MODEL_PATH
-
-        # Before we import heavy libraries, confirm there's a model to load.
-        model_url = os.environ.get('MODEL_URL')
-        print(f"[predict] MODEL_URL={'SET' if model_url else 'NOT_SET'}")
-
-        # If no MODEL_URL and no model file in repo, return a clear error without
-        # importing heavy packages that might cause process-level failures in the
-        # Vercel runtime.
-        if not model_url:
-            possible_paths = [
-                os.path.join('app', 'model.joblib'),
-                'model.joblib'
-            ]
-            found = any(os.path.exists(p) for p in possible_paths)
-            print(f"[predict] model files found in repo: {found}")
-            if not found:
-                msg = (
-                    'Model not available: set MODEL_URL to a public HTTPS model URL '
-                    'or include app/model.joblib in the repository.'
-                )
-                print(f"[predict] {msg}")
-                return ({'error': msg}, HTTPStatus.INTERNAL_SERVER_ERROR)
-
-        # Import heavy deps inside the handler so import-time failures don't crash the function
         try:
-            import joblib
-            import numpy as np
-            import tempfile
-            import urllib.request
-        except Exception as e:
+            _init_model()
+        except _InitError as e:
             tb = traceback.format_exc()
-            print(f"[predict] Import error:\n{tb}")
-            return ({'error': f'Import error: {str(e)}', 'traceback': tb}, HTTPStatus.INTERNAL_SERVER_ERROR)
+            log.error('%s\n%s', e, tb)
+            return ({'error': str(e), 'traceback': tb}, HTTPStatus.INTERNAL_SERVER_ERROR)
+        # Model initialization (when retried here) is reported under cold_start
+        mark = time.perf_counter()
 
-        try:
-            # 1) If MODEL_URL env var provided, download to /tmp once and load
-            if model_url:
-                if _MODEL is None:
-                    # download into temp path
-                    tmpdir = tempfile.gettempdir()
-                    target = os.path.join(tmpdir, 'model.joblib')
-                    print(f"[predict] target download path: {target}")
-                    if not os.path.exists(target):
-                        try:
-                            print(f"[predict] Downloading model from {model_url}...")
-                            urllib.request.urlretrieve(model_url, target)
-                            print("[predict] Download complete")
-                        except Exception as e:
-                            tb = traceback.format_exc()
-                            print(f"[predict] Failed to download model:\n{tb}")
-                            return ({'error': f'Failed to download model: {str(e)}', 'traceback': tb}, HTTPStatus.INTERNAL_SERVER_ERROR)
-                    try:
-                        print(f"[predict] Loading model from {target}")
-                        _MODEL = joblib.load(target)
-                        _MODEL_PATH = target
-                        print(f"[predict] Model loaded from {target}")
-                    except Exception as e:
-                        tb = traceback.format_exc()
-                        print(f"[predict] Failed to load model from downloaded file:\n{tb}")
-                        return ({'error': f'Failed to load model from downloaded file: {str(e)}', 'traceback': tb}, HTTPStatus.INTERNAL_SERVER_ERROR)
-            else:
-                # 2) Locate model in repository: prefer app/model.joblib then model.joblib at repo root
-                possible_paths = [
-                    os.path.join('app', 'model.joblib'),
-                    'model.joblib'
-                ]
-                model_path = None
-                print(f"[predict] Checking repository paths for model: {possible_paths}")
-                for p in possible_paths:
-                    exists = os.path.exists(p)
-                    print(f"[predict] exists({p})={exists}")
-                    if exists:
-                        model_path = p
-                        break
-
-                if model_path is None:
-                    msg = 'Model file not found; set MODEL_URL to remote model or include app/model.joblib'
-                    print(f"[predict] {msg}")
-                    return ({'error': msg}, HTTPStatus.INTERNAL_SERVER_ERROR)
-
-                try:
-                    print(f"[predict] Loading model from repo path {model_path}")
-                    _MODEL = joblib.load(model_path)
-                    _MODEL_PATH = model_path
-                    print(f"[predict] Model loaded from {model_path}")
-                except Exception as e:
-                    tb = traceback.format_exc()
-                    print(f"[predict] Failed to load model from repo path:\n{tb}")
-                    return ({'error': f'Failed to load model from repo path: {str(e)}', 'traceback': tb}, HTTPStatus.INTERNAL_SERVER_ERROR)
-
-            class_names = np.array(['setosa', 'versicolor', 'virginica'])
-
-            arr = np.array(features).reshape(1, -1)
-            prediction = _MODEL.predict(arr)
-            class_name = class_names[prediction][0]
-
-            print(f"[predict] prediction={prediction}, class_name={class_name}")
-
-            return ({'predicted_class': str(class_name)}, HTTPStatus.OK)
+        checked = _VALIDATOR.validate([features])
+        if not checked.all_valid:
+            return ({'error': '"features": %s' % checked.errors[0]['error']}, HTTPStatus.UNPROCESSABLE_ENTITY)
+        now = time.perf_counter()
+        stages['validate'], mark = now - mark, now
 
+        try:
+            prediction = _CACHE.predict(_MODEL.predict, checked.features)
+            now = time.perf_counter()
+            stages['predict'], mark = now - mark, now
+            class_name = _CLASS_NAMES[int(prediction[0])]
         except Exception as e:
             tb = traceback.format_exc()
-            print(f"[predict] Unexpected handler error:\n{tb}")
+            log.error('Unexpected handler error:\n%s', tb)
             return ({'error': str(e), 'traceback': tb}, HTTPStatus.INTERNAL_SERVER_ERROR)
 
+        if log.isEnabledFor(logging.DEBUG):
+            log.debug('features=%s prediction=%s class_name=%s', features, prediction, class_name)
+        response = ({'predicted_class': class_name}, HTTPStatus.OK)
+        stages['encode'] = time.perf_counter() - mark
+        return response
+
     except Exception as e:
         tb = traceback.format_exc()
-        print(f"[predict] Fatal error outside handler try:\n{tb}")
+        log.error('Fatal error outside handler try:\n%s', tb)
         return ({'error': str(e), 'traceback': tb}, HTTPStatus.INTERNAL_SERVER_ERROR)
@@ -0,0 +1,284 @@
+"""
+Admission control for the inference endpoints of one worker.
+
+At most ``max_in_flight`` requests are processed at a time. Further requests
+wait in a FIFO queue of at most ``max_queue`` entries, each for at most
+``queue_timeout`` seconds or until its client's deadline, whichever comes
+first. A request that finds the queue full is rejected at once (429), one
+that waits too long is dropped (503); both carry a Retry-After estimate
+from the recent service time, so a spike is shed in microseconds instead
+of queueing behind the thread pool and inflating everyone's tail latency.
+
+``AdmissionMiddleware`` applies it before a request body is even read, and
+records the time queued as the ``queue_wait`` stage, apart from inference.
+Everything runs on the worker's event loop, so no locks are needed.
+"""
+
+import asyncio
+from collections import deque
+import math
+import time
+
+from starlette.responses import JSONResponse
+
+from app import metrics
+
+# Client's remaining time budget for the request, in milliseconds
+DEADLINE_HEADER = 'X-Request-Timeout-Ms'
+_HEADER_KEY = DEADLINE_HEADER.lower().encode()
+
+shed_total = metrics.registry.counter(
+    'iris_shed_total', 'Requests rejected by admission control, by reason.', labels=('reason',),
+)
+
+# Status codes for each reason a request is shed
+STATUS_CODES = {'queue_full': 429, 'queue_timeout': 503, 'deadline': 503}
+
+
+class Overloaded(Exception):
+    """
+    Raised when a request is not admitted.
+
+    Attributes:
+        reason (str): 'queue_full', 'queue_timeout' or 'deadline' (the
+            client's deadline passed before the request could be scored).
+        retry_after (int): Suggested seconds before retrying.
+    """
+
+    def __init__(self, reason, retry_after):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def status_code(self):
+        return STATUS_CODES[self.reason]
+
+
+class AdmissionController:
+    """
+    Bounds concurrent inferences with a bounded, deadline-aware wait queue.
+
+    Args:
+        max_in_flight (int): Requests scored at once; 0 disables admission control.
+        max_queue (int): Requests allowed to wait for a slot.
+        queue_timeout (float): Longest wait for a slot, in seconds.
+    """
+
+    def __init__(self, max_in_flight=64, max_queue=256, queue_timeout=1.0):
+        self.max_in_flight = max(0, int(max_in_flight))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout = max(0.0, float(queue_timeout))
+        self._in_flight = 0
+        self._waiters = deque()
+        # Moving average of how long a request holds its slot, for Retry-After
+        self._service_time = 0.0
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = {reason: 0 for reason in STATUS_CODES}
+        # Queue wait of the requests admitted after queueing
+        self._waits = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @property
+    def enabled(self):
+        return self.max_in_flight > 0
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    def retry_after(self):
+        """Seconds until the current queue should have drained, at least 1."""
+        backlog = (len(self._waiters) + self._in_flight) * self._service_time / max(1, self.max_in_flight)
+        return max(1, math.ceil(backlog))
+
+    def _reject(self, reason):
+        self.rejected[reason] += 1
+        shed_total.inc(reason)
+        return Overloaded(reason, self.retry_after())
+
+    async def acquire(self, deadline=None):
+        """
+        Waits for an inference slot.
+
+        Args:
+            deadline (float): Event loop time by which the client needs an
+                answer; the request is dropped rather than scored after it.
+
+        Returns:
+            float: Seconds spent queued.
+
+        Raises:
+            Overloaded: The request was not admitted.
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if deadline is not None and deadline <= now:
+            raise self._reject('deadline')
+        if not self.enabled:
+            return 0.0
+        if self._in_flight < self.max_in_flight and not self._waiters:
+            self._in_flight += 1
+            self.admitted += 1
+            return 0.0
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject('queue_full')
+
+        timeout, reason = self.queue_timeout, 'queue_timeout'
+        if deadline is not None and deadline - now < timeout:
+            timeout, reason = deadline - now, 'deadline'
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            # A slot handed over at the last moment is still taken
+            if not waiter.done():
+                waiter.cancel()
+                self._waiters.remove(waiter)
+                raise self._reject(reason)
+        except asyncio.CancelledError:
+            # Client went away while queued
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            raise
+        waited = loop.time() - now
+        self.admitted += 1
+        self._waits += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        return waited
+
+    def release(self, held):
+        """Frees a slot held for ``held`` seconds, handing it to the next waiter if any."""
+        if not self.enabled:
+            return
+        self._service_time += 0.1 * (held - self._service_time)
+        self._release_slot()
+
+    async def within(self, awaitable, deadline):
+        """
+        Awaits ``awaitable``, cancelling it if the client's deadline passes first.
+
+        Raises:
+            Overloaded: The deadline passed ('deadline').
+        """
+        if deadline is None:
+            return await awaitable
+        try:
+            return await asyncio.wait_for(awaitable, deadline - asyncio.get_running_loop().time())
+        except asyncio.TimeoutError:
+            raise self._reject('deadline')
+
+    def _release_slot(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # The slot passes straight to the waiter: in-flight count unchanged
+                waiter.set_result(None)
+                return
+        self._in_flight -= 1
+
+    def stats(self):
+        """Returns slot usage, queue depth, queue wait and rejection counts."""
+        return {
+            'enabled': self.enabled,
+            'max_in_flight': self.max_in_flight,
+            'max_queue': self.max_queue,
+            'queue_timeout_ms': self.queue_timeout * 1000.0,
+            'in_flight': self._in_flight,
+            'queue_depth': self.queue_depth,
+            'admitted': self.admitted,
+            'queued': self.queued,
+            'rejected': dict(self.rejected),
+            'mean_queue_wait_ms': self._wait_total / self._waits * 1000.0 if self._waits else 0.0,
+            'max_queue_wait_ms': self._wait_max * 1000.0,
+            'mean_service_ms': self._service_time * 1000.0,
+            'retry_after_s': self.retry_after(),
+        }
+
+
+def client_deadline(budget, now):
+    """
+    Returns the event loop time by which the client needs its answer, from
+    a DEADLINE_HEADER value (milliseconds from now), or None without one.
+
+    Raises:
+        ValueError: The value is not a finite, non-negative number.
+    """
+    if budget is None:
+        return None
+    budget = float(budget)
+    if not math.isfinite(budget) or budget < 0:
+        raise ValueError('%s must be finite and non-negative, got %r' % (DEADLINE_HEADER, budget))
+    return now + budget / 1000.0
+
+
+def from_env(environ):
+    """Builds a controller from MAX_IN_FLIGHT, MAX_QUEUE and QUEUE_TIMEOUT_MS."""
+    return AdmissionController(
+        max_in_flight=int(environ.get('MAX_IN_FLIGHT', '64')),
+        max_queue=int(environ.get('MAX_QUEUE', '256')),
+        queue_timeout=float(environ.get('QUEUE_TIMEOUT_MS', '1000')) / 1000.0,
+    )
+
+
+def shed_response(exc):
+    """The 429/503 response for an Overloaded request."""
+    # No Retry-After once the client's own deadline has passed: it has given up
+    headers = {} if exc.reason == 'deadline' else {'Retry-After': str(exc.retry_after)}
+    return JSONResponse({'detail': 'Request not admitted: %s' % exc.reason.replace('_', ' ')},
+                        status_code=exc.status_code, headers=headers)
+
+
+def request_deadline(request):
+    """The client's deadline set by AdmissionMiddleware (event loop time), or None."""
+    return request.scope.get('state', {}).get('deadline')
+
+
+class AdmissionMiddleware:
+    """
+    ASGI middleware holding an admission slot for the whole of each request
+    to the given paths: body, parsing, scoring and response.
+
+    The client's deadline is left in ``request.state.deadline`` so handlers
+    can stop waiting on work the client will no longer use.
+    """
+
+    def __init__(self, app, controller, paths):
+        self.app = app
+        self.controller = controller
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        budget = next((v.decode('latin-1') for k, v in scope['headers'] if k == _HEADER_KEY), None)
+        try:
+            deadline = client_deadline(budget, asyncio.get_running_loop().time())
+        except ValueError:
+            response = JSONResponse({'detail': '%s must be a non-negative number of milliseconds' % DEADLINE_HEADER},
+                                    status_code=400)
+            await response(scope, receive, send)
+            return
+        try:
+            waited = await self.controller.acquire(deadline)
+        except Overloaded as e:
+            await shed_response(e)(scope, receive, send)
+            return
+
+        metrics.stage_seconds.observe(waited, 'queue_wait')
+        scope.setdefault('state', {})['deadline'] = deadline
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(time.perf_counter() - start)
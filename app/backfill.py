@@ -0,0 +1,310 @@
+"""
+Sharded offline scoring for backfills, on a process pool.
+
+The input is split into shards: row ranges of an ``.npy`` file (read through
+a memory map), newline-aligned byte ranges of a CSV file, or the row groups
+of a Parquet file (needs pyarrow). Each pool worker loads the model once,
+the same way the server does (``registry.ModelVersion``: load, warm,
+validator), and scores its shards in large vectorized chunks. Rows that fail
+validation get an error result instead of a prediction.
+
+Results are NDJSON, one line per input row in input order, as from score.py:
+{"predicted_class": ...} or {"error": ...}. Finished shards are appended to
+the output file in order, and ``<output>.progress.json`` records how many
+shards (and output bytes) are complete. A rerun with the same input, model
+and shard size resumes after the last finished shard, discarding anything
+written after it.
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import time
+
+import numpy as np
+
+from app import bulk
+from app.forest import artifact_fingerprint
+from app.registry import ModelVersion
+from app.serve import cpu_count
+from app.validation import DEFAULT_MARGIN, FEATURE_NAMES
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pq = None
+
+log = logging.getLogger('app.backfill')
+
+FORMATS = ('csv', 'npy', 'parquet')
+
+CLASS_NAMES = ('setosa', 'versicolor', 'virginica')
+
+DEFAULT_SHARD_ROWS = 250000
+
+# Rows per model call inside a shard
+DEFAULT_CHUNK_ROWS = 65536
+
+PROGRESS_SUFFIX = '.progress.json'
+
+# Bytes read to estimate the CSV line length when planning shards
+CSV_SAMPLE_BYTES = 1 << 16
+
+
+def input_format(path):
+    """Guesses the input format from the file extension."""
+    ext = os.path.splitext(path)[1].lower()
+    return {'.npy': 'npy', '.parquet': 'parquet', '.pq': 'parquet'}.get(ext, 'csv')
+
+
+def _is_header(line):
+    try:
+        [float(field) for field in line.split(b',')[:bulk.N_FEATURES]]
+    except ValueError:
+        return True
+    return False
+
+
+def plan_shards(path, fmt, shard_rows=DEFAULT_SHARD_ROWS):
+    """
+    Splits an input file into shards.
+
+    Returns:
+        list: One JSON-serializable task description per shard, in input order.
+    """
+    if fmt == 'npy':
+        n_rows = len(np.load(path, mmap_mode='r'))
+        return [{'rows': [start, min(start + shard_rows, n_rows)]} for start in range(0, n_rows, shard_rows)]
+
+    if fmt == 'parquet':
+        if pq is None:
+            raise RuntimeError('Parquet input needs pyarrow (pip install pyarrow)')
+        # Row groups are the unit Parquet can read independently
+        return [{'row_group': i} for i in range(pq.ParquetFile(path).num_row_groups)]
+
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        first = f.readline()
+        start = f.tell() if _is_header(first) else 0
+        f.seek(start)
+        sample = f.read(CSV_SAMPLE_BYTES)
+        line_bytes = len(sample) / max(1, sample.count(b'\n'))
+        shard_bytes = max(1, int(shard_rows * line_bytes))
+        shards = []
+        while start < size:
+            f.seek(min(start + shard_bytes, size))
+            # Shards end at a line boundary
+            f.readline()
+            end = min(f.tell(), size)
+            shards.append({'bytes': [start, end]})
+            start = end
+    return shards
+
+
+def signature(path):
+    st = os.stat(path)
+    return [os.path.abspath(path), st.st_size, st.st_mtime_ns]
+
+
+# One preformatted NDJSON line per class code, so a chunk encodes with a join;
+# the last entry, for code -1, is replaced by the row's error
+_CLASS_LINES = np.array([json.dumps({'predicted_class': name}) + '\n' for name in CLASS_NAMES] + [None],
+                        dtype=object)
+
+# The model of this pool worker, loaded once by _init_worker
+_version = None
+
+
+def _init_worker(model_path, range_margin):
+    global _version
+    _version = ModelVersion('backfill', model_path, range_margin=range_margin)
+
+
+def _score_array(X):
+    """Scores an (N, 4) array; returns (NDJSON text, error count)."""
+    X = np.asarray(X, dtype=np.float32)
+    errors = _version.validator.check(X)
+    codes = np.full(len(X), -1, dtype=np.int64)
+    if errors:
+        valid = np.ones(len(X), dtype=bool)
+        valid[list(errors)] = False
+        if valid.any():
+            codes[valid] = _version.predict(X[valid])
+    else:
+        codes = _version.predict(X)
+    lines = _CLASS_LINES[codes]
+    for i, error in errors.items():
+        lines[i] = json.dumps({'error': error}) + '\n'
+    return ''.join(lines), len(errors)
+
+
+def _score_csv_lines(lines):
+    """Scores CSV lines in one call, falling back to row-by-row parsing if any is malformed."""
+    try:
+        X = np.loadtxt(lines, delimiter=',', usecols=range(bulk.N_FEATURES), dtype=np.float32, ndmin=2)
+    except ValueError:
+        X = None
+    if X is not None and len(X) == len(lines):
+        return _score_array(X)
+    entries = [bulk.parse_entry(bulk.parse_csv_row, line.split(',')[:bulk.N_FEATURES]) for line in lines]
+    results = bulk.score_chunk(_version.predict, entries, CLASS_NAMES, _version.validator)
+    return bulk.encode_ndjson(results).decode(), sum('error' in result for result in results)
+
+
+def _shard_chunks(path, fmt, shard, chunk_rows):
+    """Yields the chunks of one shard: arrays, or lists of CSV lines."""
+    if fmt == 'npy':
+        data = np.load(path, mmap_mode='r')
+        start, stop = shard['rows']
+        for i in range(start, stop, chunk_rows):
+            yield data[i:min(i + chunk_rows, stop)]
+    elif fmt == 'parquet':
+        table = pq.ParquetFile(path).read_row_group(shard['row_group'])
+        names = list(FEATURE_NAMES) if set(FEATURE_NAMES) <= set(table.column_names) else table.column_names[:bulk.N_FEATURES]
+        # Nulls become NaN and fail validation
+        X = np.column_stack([table.column(name).to_numpy(zero_copy_only=False).astype(np.float32)
+                             for name in names])
+        for i in range(0, len(X), chunk_rows):
+            yield X[i:i + chunk_rows]
+    else:
+        start, end = shard['bytes']
+        with open(path, 'rb') as f:
+            f.seek(start)
+            text = f.read(end - start).decode()
+        # Blank lines are skipped, as by score.py
+        lines = [line for line in text.splitlines() if line.strip()]
+        for i in range(0, len(lines), chunk_rows):
+            yield lines[i:i + chunk_rows]
+
+
+def score_shard(task):
+    """
+    Scores one shard in a pool worker.
+
+    Returns:
+        tuple: (rows, errors, NDJSON bytes).
+    """
+    path, fmt, shard, chunk_rows = task
+    rows = errors = 0
+    parts = []
+    for chunk in _shard_chunks(path, fmt, shard, chunk_rows):
+        if fmt == 'csv':
+            text, n_errors = _score_csv_lines(chunk)
+        else:
+            text, n_errors = _score_array(chunk)
+        parts.append(text)
+        rows += len(chunk)
+        errors += n_errors
+    return rows, errors, ''.join(parts).encode()
+
+
+def _read_progress(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_progress(path, progress):
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(progress, f)
+    os.replace(tmp, path)
+
+
+def run(input_path, output_path, model_path, fmt=None, workers=1, shard_rows=DEFAULT_SHARD_ROWS,
+        chunk_rows=DEFAULT_CHUNK_ROWS, range_margin=DEFAULT_MARGIN, fresh=False, report=None):
+    """
+    Scores ``input_path`` into ``output_path``, resuming an interrupted run.
+
+    Args:
+        input_path (str): CSV, .npy or .parquet file.
+        output_path (str): NDJSON output file.
+        model_path (str): Model artifact, as for MODEL_PATH.
+        fmt (str): One of FORMATS; default from the file extension.
+        workers (int): Pool processes; 1 scores in this process.
+        shard_rows (int): Rows per shard (CSV: approximate; Parquet uses row groups).
+        chunk_rows (int): Rows per model call.
+        range_margin (float): As FEATURE_RANGE_MARGIN.
+        fresh (bool): Ignore earlier progress and start over.
+        report (callable): Called with the progress dict after every shard.
+
+    Returns:
+        dict: The final progress: rows, errors, elapsed_s, rows_per_s,
+        rows_per_s_per_core, ...
+    """
+    fmt = fmt or input_format(input_path)
+    if fmt not in FORMATS:
+        raise ValueError('Unknown input format %r' % fmt)
+    shards = plan_shards(input_path, fmt, shard_rows)
+    progress_path = output_path + PROGRESS_SUFFIX
+    job = {
+        'input': signature(input_path),
+        'format': fmt,
+        'shard_rows': shard_rows,
+        'model': artifact_fingerprint(model_path),
+        'shards': len(shards),
+    }
+
+    progress = None if fresh else _read_progress(progress_path)
+    if progress is not None and progress.get('job') != job:
+        log.warning('Progress file %s is for a different input, model or shard size; starting over', progress_path)
+        progress = None
+    if progress is None:
+        progress = {'job': job, 'done': 0, 'rows': 0, 'errors': 0, 'output_bytes': 0}
+        mode = 'wb'
+    else:
+        mode = 'r+b' if os.path.exists(output_path) else 'wb'
+        if mode == 'wb':
+            progress.update(done=0, rows=0, errors=0, output_bytes=0)
+        elif progress['done']:
+            log.info('Resuming after shard %d of %d', progress['done'], len(shards))
+
+    tasks = [(input_path, fmt, shard, chunk_rows) for shard in shards[progress['done']:]]
+    start = time.perf_counter()
+    resumed_rows = progress['rows']
+    pool = None
+    processes = min(workers, len(tasks)) if workers > 1 and len(tasks) > 1 else 1
+    try:
+        if processes > 1:
+            pool = multiprocessing.Pool(processes, _init_worker, (model_path, range_margin))
+            results = pool.imap(score_shard, tasks)
+        else:
+            if tasks:
+                _init_worker(model_path, range_margin)
+            results = map(score_shard, tasks)
+
+        with open(output_path, mode) as out:
+            # Drop anything written after the last recorded shard
+            out.truncate(progress['output_bytes'])
+            out.seek(progress['output_bytes'])
+            for rows, errors, data in results:
+                out.write(data)
+                out.flush()
+                os.fsync(out.fileno())
+                elapsed = time.perf_counter() - start
+                progress.update(
+                    done=progress['done'] + 1,
+                    rows=progress['rows'] + rows,
+                    errors=progress['errors'] + errors,
+                    output_bytes=progress['output_bytes'] + len(data),
+                    elapsed_s=elapsed,
+                    rows_per_s=(progress['rows'] + rows - resumed_rows) / elapsed if elapsed else 0.0,
+                )
+                _write_progress(progress_path, progress)
+                if report is not None:
+                    report(progress)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    elapsed = time.perf_counter() - start
+    scored = progress['rows'] - resumed_rows
+    progress.update(elapsed_s=elapsed, rows_per_s=scored / elapsed if elapsed else 0.0,
+                    scored_rows=scored, workers=processes,
+                    # Processes beyond the usable CPUs add no throughput
+                    rows_per_s_per_core=scored / elapsed / min(processes, cpu_count()) if elapsed else 0.0)
+    return progress
@@ -0,0 +1,108 @@
+"""
+Dynamic micro-batching for single-row predictions.
+
+Concurrent /predict calls are queued and coalesced so the forest is walked
+once per batch instead of once per request. A batch is flushed as soon as it
+reaches ``max_batch_size`` rows or the oldest queued row has waited
+``max_wait`` seconds, whichever comes first.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+
+class MicroBatcher:
+    """
+    Coalesces single-row predict calls into vectorized batches.
+
+    Args:
+        predict_fn (callable): Takes an (N, F) float32 array and returns N results.
+        max_batch_size (int): Flush once this many rows are queued.
+        max_wait (float): Flush once the oldest queued row is this many seconds old.
+    """
+
+    def __init__(self, predict_fn, max_batch_size=32, max_wait=0.002):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait))
+        # A single worker thread: batches are already vectorized, and one
+        # thread keeps model calls from contending with each other on the GIL.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='batcher')
+        self._loop = None
+        self._queue = None
+        self._worker = None
+        self._batches = 0
+        self._rows = 0
+        self._last_batch_size = 0
+        self._max_batch_size_seen = 0
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._worker is None or self._worker.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._worker = loop.create_task(self._run())
+
+    async def submit(self, row):
+        """Queues one feature row and waits for its own prediction."""
+        self._ensure_started()
+        future = self._loop.create_future()
+        self._queue.put_nowait((row, future))
+        return await future
+
+    async def _collect(self):
+        batch = [await self._queue.get()]
+        deadline = self._loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - self._loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # Callers that gave up (client disconnects) are not worth scoring
+            batch = [(row, future) for row, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            self._batches += 1
+            self._rows += len(batch)
+            self._last_batch_size = len(batch)
+            self._max_batch_size_seen = max(self._max_batch_size_seen, len(batch))
+
+            features = np.asarray([row for row, _ in batch], dtype=np.float32)
+            try:
+                results = await self._loop.run_in_executor(self._executor, self.predict_fn, features)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self):
+        """Returns queue depth and realized batch sizes."""
+        return {
+            'queue_depth': self._queue.qsize() if self._queue is not None else 0,
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'batches': self._batches,
+            'rows': self._rows,
+            'last_batch_size': self._last_batch_size,
+            'max_batch_size_seen': self._max_batch_size_seen,
+            'mean_batch_size': self._rows / self._batches if self._batches else 0.0,
+        }
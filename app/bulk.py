@@ -0,0 +1,127 @@
+"""
+Chunked bulk scoring shared by /predict/stream and the score.py CLI.
+
+Input rows are parsed one line at a time, grouped into fixed-size chunks and
+scored with one vectorized predict per chunk, so memory stays proportional to
+the chunk size however large the input is. Every input row yields exactly one
+result, in order: {"predicted_class": ...}, or {"error": ...} for a row that
+could not be parsed or failed validation (the rest of its chunk is still
+scored). Rows are converted and checked by ``Validator.validate``, as for
+/predict/batch, so every scoring path accepts and rejects the same rows
+with the same messages.
+"""
+
+import csv
+import json
+
+from app.validation import Validator
+
+DEFAULT_CHUNK_SIZE = 4096
+
+N_FEATURES = 4
+
+
+def parse_json_row(line):
+    """Parses one NDJSON line: {"features": [f1, f2, f3, f4]} or a bare [f1, f2, f3, f4]."""
+    record = json.loads(line)
+    if isinstance(record, dict):
+        if 'features' not in record:
+            raise ValueError('missing "features"')
+        record = record['features']
+    return _check_row(record)
+
+
+def parse_csv_row(fields):
+    """Parses one CSV record of four numeric fields."""
+    return _check_row([float(field) for field in fields])
+
+
+def _check_row(row):
+    # Only the shape of an entry; its values are checked with its chunk by the validator
+    if not isinstance(row, list):
+        raise ValueError('expected %d features' % N_FEATURES)
+    return row
+
+
+def parse_entry(parse, raw):
+    """Returns the parsed row, or the error message if it cannot be parsed."""
+    try:
+        return parse(raw)
+    except (ValueError, TypeError) as e:
+        return str(e) or type(e).__name__
+
+
+def score_chunk(predict, entries, class_names, validator=None):
+    """
+    Scores a chunk of parsed entries with a single predict call.
+
+    Args:
+        predict (callable): Maps an (N, 4) float32 array to N class codes.
+        entries (list): Feature rows, or error strings from ``parse_entry``.
+        class_names: Sequence mapping class codes to names.
+        validator (Validator): Converts and checks the rows exactly as for
+            /predict/batch (see app/validation.py), ranges included; rows it
+            rejects get an error result and are not scored. Default: shape,
+            type and finiteness checks only.
+
+    Returns:
+        list: One result dict per entry, in order.
+    """
+    results = [{'error': entry} if isinstance(entry, str) else None for entry in entries]
+    parsed = [i for i, entry in enumerate(entries) if not isinstance(entry, str)]
+    if parsed:
+        checked = (validator or Validator()).validate([entries[i] for i in parsed])
+        for error in checked.errors:
+            results[parsed[error['index']]] = {'error': error['error']}
+        valid = [i for i, ok in zip(parsed, checked.valid.tolist()) if ok]
+        if valid:
+            for i, prediction in zip(valid, predict(checked.features[checked.valid])):
+                results[i] = {'predicted_class': str(class_names[prediction])}
+    return results
+
+
+def encode_ndjson(results):
+    """Encodes results as NDJSON bytes, one line per result."""
+    return ''.join(json.dumps(result) + '\n' for result in results).encode()
+
+
+def iter_chunks(entries, chunk_size=DEFAULT_CHUNK_SIZE):
+    chunk = []
+    for entry in entries:
+        chunk.append(entry)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_entries(stream, fmt):
+    """
+    Lazily parses a text stream of 'jsonl' or 'csv' records.
+
+    Blank lines are skipped. A CSV header row (non-numeric first record) is
+    skipped; extra columns after the four features are ignored.
+    """
+    if fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                yield parse_entry(parse_json_row, line)
+        return
+
+    reader = csv.reader(stream)
+    for n, fields in enumerate(reader):
+        if not fields:
+            continue
+        if n == 0:
+            try:
+                [float(field) for field in fields[:N_FEATURES]]
+            except ValueError:
+                continue
+        yield parse_entry(parse_csv_row, fields[:N_FEATURES])
+
+
+def score_stream(predict, entries, class_names, chunk_size=DEFAULT_CHUNK_SIZE, validator=None):
+    """Scores an iterable of parsed entries chunk by chunk, yielding each chunk's results."""
+    for chunk in iter_chunks(entries, chunk_size):
+        yield score_chunk(predict, chunk, class_names, validator)
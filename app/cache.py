@@ -0,0 +1,154 @@
+"""
+In-process prediction cache keyed on (optionally quantized) feature vectors.
+
+Iris traffic is highly repetitive, so a bounded LRU cache with a TTL in front
+of the model skips the forest entirely for rows seen recently. Entries belong
+to one model fingerprint; binding a different fingerprint clears the cache,
+so a changed artifact never serves stale predictions.
+"""
+
+from collections import OrderedDict
+import threading
+import time
+
+import numpy as np
+
+
+class PredictionCache:
+    """
+    Bounded LRU + TTL cache from feature tuples to class codes.
+
+    Args:
+        max_size (int): Maximum number of entries; 0 disables caching.
+        ttl (float): Seconds an entry stays valid; None or 0 for no expiry.
+        precision (int): If set, features are rounded to this many decimals
+            before keying, so near-identical rows share an entry.
+        clock (callable): Monotonic time source, replaceable for tests.
+    """
+
+    def __init__(self, max_size=10000, ttl=300.0, precision=None, clock=time.monotonic):
+        self.max_size = max(0, int(max_size))
+        self.ttl = float(ttl) if ttl else None
+        self.precision = precision
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.fingerprint = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def bind(self, fingerprint):
+        """Ties the cache to a model artifact; a different fingerprint clears it."""
+        with self._lock:
+            if fingerprint != self.fingerprint:
+                if self._entries:
+                    self.invalidations += 1
+                self._entries.clear()
+                self.fingerprint = fingerprint
+
+    def keys(self, features):
+        """Returns one hashable key per row of an (N, F) array."""
+        features = np.asarray(features, dtype=np.float32)
+        if self.precision is not None:
+            features = np.round(features, self.precision)
+        return [tuple(row) for row in features.tolist()]
+
+    def get_many(self, keys):
+        """Returns the cached value for each key, None for misses."""
+        now = self._clock()
+        values = []
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None and self.ttl is not None and now - entry[1] > self.ttl:
+                    del self._entries[key]
+                    self.expirations += 1
+                    entry = None
+                if entry is None:
+                    self.misses += 1
+                    values.append(None)
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    values.append(entry[0])
+        return values
+
+    def put_many(self, keys, values, fingerprint=None):
+        """
+        Stores values; skipped if ``fingerprint`` is given and the cache has
+        since been bound to a different model (a reload raced the prediction).
+        """
+        if not self.enabled or (fingerprint is not None and fingerprint != self.fingerprint):
+            return
+        now = self._clock()
+        with self._lock:
+            for key, value in zip(keys, values):
+                self._entries[key] = (value, now)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def predict(self, predict_fn, features, fingerprint=None):
+        """
+        Predicts an (N, F) batch, sending only cache misses to ``predict_fn``.
+
+        ``fingerprint`` identifies the model behind ``predict_fn``; see put_many.
+
+        Returns:
+            np.ndarray: One prediction per row, in order.
+        """
+        features = np.asarray(features, dtype=np.float32)
+        if not self.enabled:
+            return predict_fn(features)
+        keys = self.keys(features)
+        cached = self.get_many(keys)
+        # Each distinct missing key is scored once, from its first row
+        missing = {}
+        for i, value in enumerate(cached):
+            if value is None:
+                missing.setdefault(keys[i], i)
+        if not missing:
+            return np.asarray(cached)
+        predictions = predict_fn(features[list(missing.values())]).tolist()
+        self.put_many(list(missing), predictions, fingerprint)
+        by_key = dict(zip(missing, predictions))
+        for i, value in enumerate(cached):
+            if value is None:
+                cached[i] = by_key[keys[i]]
+        return np.asarray(cached)
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            'size': size,
+            'max_size': self.max_size,
+            'ttl_s': self.ttl,
+            'precision': self.precision,
+            'fingerprint': self.fingerprint,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+        }
+
+
+def from_env(environ):
+    """Builds a cache from CACHE_SIZE, CACHE_TTL and CACHE_PRECISION."""
+    precision = environ.get('CACHE_PRECISION')
+    return PredictionCache(
+        max_size=int(environ.get('CACHE_SIZE', '10000')),
+        ttl=float(environ.get('CACHE_TTL', '300')),
+        precision=int(precision) if precision not in (None, '') else None,
+    )
@@ -0,0 +1,205 @@
+"""
+Content negotiation for the predict endpoints.
+
+Request bodies (by Content-Type):
+    application/json        {"features": [...]} / {"instances": [[...], ...]} (default)
+    application/x-msgpack   the same payloads, msgpack-encoded
+    application/octet-stream
+                            raw little-endian float32 rows, N x 4, decoded
+                            zero-copy with np.frombuffer
+
+Responses (by Accept):
+    application/json        class names (default)
+    application/x-msgpack   the same response object, msgpack-encoded
+    application/octet-stream
+                            one int8 class code per row; the code-to-name
+                            mapping is in the X-Class-Names header. When
+                            probabilities are requested, the dense N x 3
+                            little-endian float32 probability block instead,
+                            columns in X-Class-Names order.
+
+msgpack is optional: without it installed, msgpack requests get a 415.
+"""
+
+import json
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse, Response
+import numpy as np
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional dependency
+    msgpack = None
+
+JSON = 'application/json'
+MSGPACK = 'application/x-msgpack'
+OCTET = 'application/octet-stream'
+
+# Body layout for application/octet-stream
+FLOAT32_LE = np.dtype('<f4')
+
+
+def media_type(header):
+    """Returns the bare media type of a Content-Type header value."""
+    return (header or '').split(';', 1)[0].strip().lower()
+
+
+def decode(body, content_type, n_features):
+    """
+    Decodes a request body.
+
+    Returns:
+        A dict for JSON and msgpack bodies, or an (N, n_features) float32
+        array (a read-only view over ``body``) for octet-stream bodies.
+    """
+    kind = media_type(content_type)
+    if kind == OCTET:
+        row_bytes = FLOAT32_LE.itemsize * n_features
+        if not body or len(body) % row_bytes:
+            raise HTTPException(
+                status_code=400,
+                detail='Binary body must be N x %d little-endian float32 values' % n_features,
+            )
+        return np.frombuffer(body, dtype=FLOAT32_LE).reshape(-1, n_features)
+
+    if kind == MSGPACK:
+        if msgpack is None:
+            raise HTTPException(status_code=415, detail='msgpack is not installed on this server')
+        try:
+            data = msgpack.unpackb(body, raw=False)
+        except Exception:
+            raise HTTPException(status_code=400, detail='Invalid msgpack body')
+    elif kind in ('', JSON) or kind.endswith('+json'):
+        try:
+            data = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail='Invalid JSON body')
+    else:
+        raise HTTPException(status_code=415, detail='Unsupported Content-Type %r' % kind)
+
+    if not isinstance(data, dict):
+        raise HTTPException(status_code=422, detail='Body must be an object')
+    return data
+
+
+# Accept media ranges answered as one of the response types
+ACCEPT_ALIASES = {'*/*': JSON, 'application/*': JSON, 'application/msgpack': MSGPACK}
+
+
+def accepts(accept_header):
+    """
+    Picks the response media type from an Accept header; JSON unless asked otherwise.
+
+    Media ranges are weighed by their q-values: the type with the highest q
+    wins, the first listed on a tie, and q=0 rules a type out. Wildcards
+    stand for JSON, and msgpack counts only when it is installed.
+    """
+    offered = (JSON, OCTET, MSGPACK) if msgpack is not None else (JSON, OCTET)
+    best, best_q = JSON, 0.0
+    for media_range in (accept_header or '').split(','):
+        kind, *params = [part.strip().lower() for part in media_range.split(';')]
+        kind = ACCEPT_ALIASES.get(kind, kind)
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    # A malformed weight makes the range unusable
+                    q = 0.0
+        if kind in offered and q > best_q:
+            best, best_q = kind, q
+    return best
+
+
+def probability_fields(proba, class_names, include_proba, top_k):
+    """
+    The JSON/msgpack response fields for class probabilities.
+
+    For one row (``proba`` of shape (n_classes,)): "probabilities" maps class
+    names to scores and "top_k" is a list of {"class", "score"}. For a batch:
+    "probabilities" is an N x n_classes list of lists with columns in
+    "class_names" order, and "top_k" holds one such list per row.
+    """
+    single = proba.ndim == 1
+    proba = np.atleast_2d(proba)
+    # float32 carries ~7 significant digits; rounding drops float32-to-float64 noise
+    scores = np.round(proba.astype(np.float64), 6)
+    fields = {}
+    if include_proba:
+        if single:
+            fields['probabilities'] = dict(zip(class_names.tolist(), scores[0].tolist()))
+        else:
+            fields['probabilities'] = scores.tolist()
+            fields['class_names'] = class_names.tolist()
+    if top_k:
+        order = np.argsort(-proba, axis=1, kind='stable')[:, :top_k]
+        names = class_names[order].tolist()
+        top = np.take_along_axis(scores, order, axis=1).tolist()
+        rows = [[{'class': n, 'score': s} for n, s in zip(row_names, row_scores)]
+                for row_names, row_scores in zip(names, top)]
+        fields['top_k'] = rows[0] if single else rows
+    return fields
+
+
+def encode(predictions, class_names, accept_header, key, proba=None, include_proba=False, top_k=0, errors=None):
+    """
+    Encodes class codes as the response type the client asked for.
+
+    Args:
+        predictions: Class codes (indices into ``class_names``), one per row.
+        class_names: Array mapping codes to names.
+        accept_header (str): The request's Accept header.
+        key (str): Response field holding the class name(s) for JSON/msgpack.
+        proba: Float32 probabilities, (n_classes,) or (N, n_classes), from
+            the same pass as ``predictions``; needed for the options below.
+        include_proba (bool): Add the probabilities to the response.
+        top_k (int): Add the top k classes with their scores (JSON/msgpack only).
+        errors (list): [{"index", "error"}] for batch rows that failed
+            validation. Their code is -1 (int8) and their probabilities NaN
+            in binary responses; in JSON/msgpack their entries are null and
+            the list is returned as "errors".
+    """
+    kind = accepts(accept_header)
+    codes = np.asarray(predictions)
+    if kind == OCTET:
+        headers = {'X-Class-Names': ','.join(class_names.tolist())}
+        if top_k:
+            raise HTTPException(status_code=406, detail='top_k is only available as JSON or msgpack')
+        if include_proba:
+            block = np.atleast_2d(proba).astype(FLOAT32_LE)
+            headers['X-Shape'] = '%d,%d' % block.shape
+            return Response(content=block.tobytes(), media_type=OCTET, headers=headers)
+        return Response(content=codes.astype(np.int8).tobytes(), media_type=OCTET, headers=headers)
+
+    names = class_names[codes]
+    content = {key: names.tolist() if names.ndim else str(names)}
+    if include_proba or top_k:
+        content.update(probability_fields(proba, class_names, include_proba, top_k))
+    if errors:
+        for field in (key, 'probabilities', 'top_k'):
+            if field in content:
+                for error in errors:
+                    content[field][error['index']] = None
+        content['errors'] = errors
+    if kind == MSGPACK:
+        return Response(content=msgpack.packb(content), media_type=MSGPACK)
+    return JSONResponse(content)
+
+
+# Request body documentation for the OpenAPI schema, since the endpoints
+# read the raw body themselves.
+def openapi_body(example, schema=None):
+    """The OpenAPI requestBody for a predict endpoint; ``schema`` describes the JSON form."""
+    return {
+        'requestBody': {
+            'required': True,
+            'content': {
+                JSON: {'schema': schema or {'type': 'object'}, 'example': example},
+                MSGPACK: {'schema': {'type': 'string', 'format': 'binary'}},
+                OCTET: {'schema': {'type': 'string', 'format': 'binary'}},
+            },
+        },
+    }
@@ -0,0 +1,185 @@
+"""
+Content-addressed download cache for model artifacts (MODEL_URL).
+
+Downloads are written to a ``.part`` file and renamed into place only once
+complete and verified, so an interrupted download can never be loaded. The
+cache layout under ``cache_dir``:
+
+    <sha256><suffix>        verified artifacts, named by their content hash
+    url-<key>.json          per-URL metadata: the ETag and sha256 last fetched
+    url-<key>.part          an in-progress download, resumed with HTTP Range
+    url-<key>.lock          held (flock) by the one process downloading the URL
+
+With an expected sha256 the artifact is fetched at most once and later calls
+never touch the network. Without one, a cached artifact is revalidated with
+If-None-Match on each call; if the server is unreachable the cached copy is
+used.
+
+Only the standard library is used, so the serverless cold start stays cheap.
+"""
+
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import urllib.error
+import urllib.request
+
+log = logging.getLogger('app.download')
+
+BLOCK_SIZE = 1 << 20
+
+# Returned by _download for a 304 response
+NOT_MODIFIED = object()
+
+
+class DownloadError(Exception):
+    """The artifact could not be downloaded or failed verification."""
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_json(path, data):
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@contextlib.contextmanager
+def _locked(path):
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _download(url, part, timeout, if_none_match=None):
+    """
+    Downloads ``url`` into ``part``, resuming from its current size.
+
+    Returns:
+        The response ETag (possibly None), or NOT_MODIFIED if the server
+        answered 304 to ``if_none_match``.
+    """
+    offset = os.path.getsize(part) if os.path.exists(part) else 0
+    part_meta = _read_json(part + '.json')
+    request = urllib.request.Request(url)
+    if if_none_match:
+        request.add_header('If-None-Match', if_none_match)
+    if offset:
+        request.add_header('Range', 'bytes=%d-' % offset)
+        # A changed resource is sent whole (200) instead of a mismatched range
+        if part_meta.get('etag'):
+            request.add_header('If-Range', part_meta['etag'])
+    try:
+        response = urllib.request.urlopen(request, timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and if_none_match:
+            return NOT_MODIFIED
+        if e.code == 416 and offset:
+            # The partial file is complete (or unusable): start over
+            os.remove(part)
+            return _download(url, part, timeout, if_none_match)
+        raise
+
+    with response:
+        etag = response.headers.get('ETag')
+        if response.status == 206:
+            log.info('Resuming download of %s at byte %d', url, offset)
+            mode = 'ab'
+        else:
+            mode = 'wb'
+        _write_json(part + '.json', {'url': url, 'etag': etag})
+        with open(part, mode) as f:
+            for block in iter(lambda: response.read(BLOCK_SIZE), b''):
+                f.write(block)
+        # Content-Range is 'bytes start-end/total' on a 206
+        total = response.headers.get('Content-Range', '').rpartition('/')[2]
+        if response.status == 200:
+            total = response.headers.get('Content-Length')
+        if total and total != '*' and os.path.getsize(part) != int(total):
+            raise DownloadError('Truncated download of %s' % url)
+    return etag
+
+
+def fetch(url, cache_dir, sha256=None, suffix='', timeout=30.0):
+    """
+    Returns the local path of the artifact at ``url``, downloading it if needed.
+
+    Args:
+        url (str): The artifact URL.
+        cache_dir (str): Cache directory (created if missing).
+        sha256 (str): Expected hex digest; the download is rejected if it differs.
+        suffix (str): File name suffix for the cached artifact, e.g. '.joblib'.
+        timeout (float): Socket timeout in seconds.
+
+    Raises:
+        DownloadError: The download failed, or its sha256 did not match.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    sha256 = sha256.lower() if sha256 else None
+    if sha256:
+        path = os.path.join(cache_dir, sha256 + suffix)
+        if os.path.exists(path):
+            return path
+
+    key = hashlib.sha256(url.encode()).hexdigest()[:16]
+    base = os.path.join(cache_dir, 'url-' + key)
+    part = base + '.part'
+
+    with _locked(base + '.lock'):
+        # Another process may have finished the download while we waited
+        if sha256 and os.path.exists(path):
+            return path
+        meta = _read_json(base + '.json')
+        cached = os.path.join(cache_dir, meta['sha256'] + suffix) if meta.get('sha256') else None
+        if cached and not os.path.exists(cached):
+            cached = None
+
+        # Without a pinned sha256, a cached artifact is revalidated: a 304
+        # means it is still current, a 200 is downloaded as a new version.
+        revalidate = meta.get('etag') if cached and not sha256 else None
+        try:
+            etag = _download(url, part, timeout, revalidate)
+        except DownloadError:
+            raise
+        except Exception as e:
+            if cached and not sha256:
+                log.warning('Revalidating %s failed (%s); using the cached copy', url, e)
+                return cached
+            # The partial file is kept, so the next attempt resumes it
+            raise DownloadError('Failed to download %s: %s' % (url, e))
+        if etag is NOT_MODIFIED:
+            return cached
+
+        digest = file_sha256(part)
+        if sha256 and digest != sha256:
+            os.remove(part)
+            os.remove(part + '.json')
+            raise DownloadError('sha256 mismatch for %s: expected %s, got %s' % (url, sha256, digest))
+        target = os.path.join(cache_dir, digest + suffix)
+        os.replace(part, target)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(part + '.json')
+        _write_json(base + '.json', {'url': url, 'etag': etag, 'sha256': digest})
+        log.info('Downloaded %s to %s', url, target)
+        return target
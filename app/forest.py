@@ -0,0 +1,236 @@
+"""
+Flat, array-backed representation of a fitted RandomForestClassifier.
+
+sklearn evaluates a forest one estimator at a time, which for tiny iris rows
+means the per-tree Python dispatch costs more than the tree walk itself.
+``compile_forest`` packs every tree into shared contiguous arrays, and
+``CompiledForest`` walks all trees for a whole batch together, one NumPy
+step per tree depth level, with results bit-identical to sklearn's.
+
+The compiled artifact is a directory of raw ``.npy`` files. It is opened with
+``mmap_mode='r'`` so pages are faulted in lazily and shared, through the page
+cache, by every process serving the same file. Older single-file ``.npz``
+artifacts still load, but are read fully into memory.
+
+Usage:
+    python -m app.forest app/model.joblib   # writes app/model.forest/
+"""
+
+import hashlib
+import os
+import sys
+
+import numpy as np
+
+COMPILED_SUFFIX = '.forest'
+
+# Arrays stored in a compiled artifact, one .npy file each
+ARRAY_NAMES = ('feature', 'threshold', 'left', 'right', 'value', 'roots', 'classes',
+               'max_depth', 'n_features')
+
+# Rows scored per traversal chunk; bounds the (trees, rows, classes) buffer
+CHUNK_ROWS = 4096
+
+
+def compile_forest(model):
+    """
+    Converts a fitted sklearn forest classifier into flat arrays.
+
+    All trees' nodes are concatenated; child indices are global. Leaves point
+    to themselves so a fixed number of traversal steps is always safe.
+
+    Args:
+        model: A fitted RandomForestClassifier (or any single-output forest
+            classifier whose estimators expose ``tree_``).
+
+    Returns:
+        dict: Arrays ready to be passed to ``CompiledForest``.
+    """
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        n = tree.node_count
+        is_leaf = tree.children_left == -1
+        node_ids = np.arange(n, dtype=np.int64)
+
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(tree.threshold.astype(np.float64))
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right) + offset)
+
+        # Same normalization as DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :model.n_classes_].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(value / normalizer)
+
+        roots.append(offset)
+        max_depth = max(max_depth, tree.max_depth)
+        offset += n
+
+    return {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'left': np.concatenate(lefts).astype(np.int32),
+        'right': np.concatenate(rights).astype(np.int32),
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int32),
+        'classes': np.asarray(model.classes_),
+        'max_depth': np.int32(max_depth),
+        'n_features': np.int32(model.n_features_in_),
+    }
+
+
+class CompiledForest:
+    """
+    Vectorized inference over a compiled forest.
+
+    Exposes the subset of the sklearn classifier API the servers use:
+    ``predict``, ``predict_proba``, ``classes_`` and ``n_features_in_``.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, roots, classes,
+                 max_depth, n_features):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.classes_ = classes
+        # Scalars come back from a memory-mapped .npy with shape (1,), not ()
+        self.max_depth = int(np.asarray(max_depth).item())
+        self.n_features_in_ = int(np.asarray(n_features).item())
+        self.n_estimators = len(roots)
+        # Interleaved (left, right) pairs: the next node is children[2 * node + went_right]
+        self._children = np.stack([left, right], axis=1).ravel().astype(np.int64)
+
+    @classmethod
+    def from_model(cls, model):
+        return cls(**compile_forest(model))
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Loads a compiled artifact.
+
+        Args:
+            path (str): An artifact directory, or a legacy ``.npz`` file.
+            mmap_mode (str): Passed to ``np.load`` for directory artifacts;
+                None reads the arrays into private memory instead.
+        """
+        if os.path.isdir(path):
+            return cls(**{
+                name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+                for name in ARRAY_NAMES
+            })
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+    def arrays(self):
+        return {
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'left': self.left,
+            'right': self.right,
+            'value': self.value,
+            'roots': self.roots,
+            'classes': self.classes_,
+            'max_depth': np.int32(self.max_depth),
+            'n_features': np.int32(self.n_features_in_),
+        }
+
+    def save(self, path):
+        """Writes the artifact as a directory of uncompressed, mmap-able .npy files."""
+        os.makedirs(path, exist_ok=True)
+        for name, array in self.arrays().items():
+            np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(array))
+
+    def apply(self, X):
+        """Returns the global leaf index reached in every tree, shape (n_trees, N)."""
+        X = np.asarray(X, dtype=np.float32)
+        n_rows = X.shape[0]
+        # Column-major copy of X so a (feature, row) pair is one flat offset
+        columns = np.ascontiguousarray(X.T).ravel()
+        feature_offsets = self.feature.astype(np.int64) * n_rows
+        row_offsets = np.arange(n_rows, dtype=np.int64)[np.newaxis, :]
+        nodes = np.repeat(self.roots.astype(np.int64)[:, np.newaxis], n_rows, axis=1)
+        for _ in range(self.max_depth):
+            values = columns.take(feature_offsets.take(nodes) + row_offsets)
+            # float32 input against float64 thresholds, as in sklearn
+            go_right = ~(values <= self.threshold.take(nodes))
+            nodes = self._children.take(2 * nodes + go_right)
+        return nodes
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError('X must have shape (n_samples, %d)' % self.n_features_in_)
+        proba = np.empty((X.shape[0], len(self.classes_)), dtype=np.float64)
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            stop = start + CHUNK_ROWS
+            leaf_values = self.value[self.apply(X[start:stop])]
+            # sklearn adds the trees' probabilities one at a time, in order.
+            # Reducing over the outermost (tree) axis of a C-contiguous array
+            # adds whole rows in that same order, so the floats match exactly.
+            proba[start:stop] = np.add.reduce(leaf_values, axis=0)
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X):
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
+
+
+def compiled_path(model_path):
+    """Returns the compiled artifact path that sits next to a joblib model."""
+    root, _ = os.path.splitext(model_path)
+    return root + COMPILED_SUFFIX
+
+
+def load_model(path):
+    """Loads either a compiled forest artifact or a joblib-pickled sklearn model."""
+    if os.path.isdir(path) or path.endswith('.npz'):
+        return CompiledForest.load(path)
+    import joblib
+    # Memory-maps any large arrays stored uncompressed in the pickle
+    return joblib.load(path, mmap_mode='r')
+
+
+def artifact_fingerprint(path):
+    """Returns a sha256 hex digest of a model artifact file or directory."""
+    digest = hashlib.sha256()
+    files = [path]
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    for name in files:
+        digest.update(os.path.basename(name).encode())
+        with open(name, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def find_model(candidates):
+    """
+    Returns the first existing model path, preferring compiled artifacts.
+
+    Each candidate is a joblib path; its compiled siblings (directory, then
+    legacy .npz) are tried first. Returns None when nothing exists.
+    """
+    for path in candidates:
+        compiled = compiled_path(path)
+        for option in (compiled, compiled + '.npz', path):
+            if os.path.exists(option):
+                return option
+    return None
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join('app', 'model.joblib')
+    import joblib
+    forest = CompiledForest.from_model(joblib.load(source))
+    forest.save(compiled_path(source))
+    print('Compiled %d trees (%d nodes) to %s/' % (
+        forest.n_estimators, len(forest.feature), compiled_path(source)))
@@ -0,0 +1,249 @@
+"""
+Minimal Prometheus-style metrics for the inference paths.
+
+Counters and fixed-bucket histograms, rendered in the Prometheus text
+exposition format by ``Registry.render``. Recording is a perf_counter call,
+a bisect and a couple of adds under a lock, about a microsecond per
+observation, so timing every stage of a request adds roughly 10us, under 1%
+of a served request.
+"""
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import threading
+import time
+
+import numpy as np
+
+# Seconds; spans sub-10us array conversions up to multi-second model loads
+DEFAULT_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs)
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by label values."""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def value(self, *label_values):
+        return self._values.get(label_values, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            yield self.name + _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    """Observations counted into fixed cumulative buckets, optionally split by labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (last slot is +Inf), sum, count
+                series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *label_values)
+
+    def count(self, *label_values):
+        series = self._series.get(label_values)
+        return series[2] if series else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((k, ([*v[0]], v[1], v[2])) for k, v in self._series.items())
+        for label_values, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield self.name + '_bucket' + _format_labels(self.labels, label_values, [('le', le)]), cumulative
+            yield self.name + '_sum' + _format_labels(self.labels, label_values), total
+            yield self.name + '_count' + _format_labels(self.labels, label_values), count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labels=()):
+        metric = Counter(name, help, labels)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """Returns all metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.help))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            for name, value in metric.samples():
+                lines.append('%s %s' % (name, repr(float(value)) if isinstance(value, float) else value))
+        return '\n'.join(lines) + '\n'
+
+
+# Content-Type for Registry.render output
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# The metrics both servers record
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    'iris_stage_seconds',
+    'Time spent in each inference stage (parse, validate, to_array, queue_wait, batch_wait, predict, encode).',
+    labels=('stage',),
+)
+model_load_seconds = registry.histogram(
+    'iris_model_load_seconds', 'Time to load the model artifact.',
+)
+model_swaps_total = registry.counter(
+    'iris_model_swaps_total', 'Hot reloads that replaced the current model version.',
+)
+request_seconds = registry.histogram(
+    'iris_request_seconds', 'End-to-end request latency by endpoint.', labels=('endpoint',),
+)
+requests_total = registry.counter(
+    'iris_requests_total', 'Prediction requests by endpoint and outcome.', labels=('endpoint', 'outcome'),
+)
+predictions_total = registry.counter(
+    'iris_predictions_total', 'Predicted rows by class.', labels=('class_name',),
+)
+rows_total = registry.counter(
+    'iris_rows_total', 'Rows sent to the model (after cache hits are removed).',
+)
+
+
+def outcome(status_code):
+    """Buckets an HTTP status into ok / client_error / server_error."""
+    status_code = int(status_code)
+    if status_code < 400:
+        return 'ok'
+    return 'client_error' if status_code < 500 else 'server_error'
+
+
+def count_predictions(codes, class_names):
+    """Adds predicted class codes to the per-class counter."""
+    codes = np.asarray(codes, dtype=np.int64).ravel()
+    if codes.size == 1:
+        predictions_total.inc(str(class_names[codes[0]]))
+        return
+    counts = np.bincount(codes, minlength=len(class_names))
+    for code, n in enumerate(counts.tolist()):
+        if n:
+            predictions_total.inc(str(class_names[code]), amount=n)
+
+
+class StageTimer:
+    """
+    Records consecutive stages of one request: each ``lap(stage)`` observes
+    the time since the previous lap (or since creation).
+
+    The durations are also kept in ``laps`` for per-request structured logs.
+    """
+
+    __slots__ = ('last', 'laps')
+
+    def __init__(self):
+        self.last = time.perf_counter()
+        self.laps = {}
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        elapsed = now - self.last
+        stage_seconds.observe(elapsed, stage)
+        self.laps[stage] = self.laps.get(stage, 0.0) + elapsed
+        self.last = now
+
+    def skip(self):
+        """Starts the next stage now, without recording the time since the last lap."""
+        self.last = time.perf_counter()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests by endpoint and outcome and timing them
+    end to end. Only the given paths are recorded.
+    """
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = frozenset(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            path = scope['path']
+            request_seconds.observe(time.perf_counter() - start, path)
+            requests_total.inc(path, outcome(status[0]))
+
+
+def timed_predict(predict_fn):
+    """Wraps a model's predict so every call is recorded as the predict stage."""
+    def predict(features):
+        start = time.perf_counter()
+        try:
+            return predict_fn(features)
+        finally:
+            stage_seconds.observe(time.perf_counter() - start, 'predict')
+            rows_total.inc(amount=len(features))
+    return predict
@@ -0,0 +1,166 @@
+"""
+Adaptive parallel execution of model calls.
+
+Small batches (every single-row /predict) are scored inline: handing them to
+other threads costs more than it saves. Batches of at least ``threshold``
+rows are split into row chunks scored concurrently on a persistent thread
+pool. The forest code (numpy here, Cython in sklearn) releases the GIL for
+the heavy work, so the chunks really run in parallel, and every row is
+scored exactly as it would be inline.
+
+The pool is sized to this process's share of the container's CPUs (the
+cgroup quota divided by the worker count). The threshold is measured at
+startup: ``calibrate`` times a few batch sizes inline and in parallel and
+picks the smallest size where parallel wins. With a single thread there is
+nothing to calibrate and everything runs inline.
+
+The pool is recreated in forked children, so a calibrated executor can be
+built before ``app.serve`` forks its workers.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import math
+import os
+import time
+
+import numpy as np
+
+from app.serve import cpu_count, cpu_quota
+
+log = logging.getLogger('app.parallel')
+
+# Batch sizes tried by calibrate, smallest first
+CALIBRATION_SIZES = (512, 2048, 8192)
+
+# Parallel must be at least this much faster to count as a win
+CALIBRATION_MARGIN = 0.9
+
+
+def default_threads(workers=1):
+    """This process's share of the CPU quota when ``workers`` processes share it."""
+    cpus = cpu_count()
+    quota = cpu_quota()
+    if quota:
+        # A fractional quota cannot keep another thread busy
+        cpus = min(cpus, math.floor(quota))
+    return max(1, cpus // max(1, workers))
+
+
+class ParallelExecutor:
+    """
+    Runs a batch function inline or split by rows across a thread pool.
+
+    Args:
+        threads (int): Pool size; 1 disables parallelism.
+        threshold (int): Minimum rows for the parallel path; None until calibrated.
+    """
+
+    def __init__(self, threads=1, threshold=None):
+        self.threads = max(1, int(threads))
+        self.threshold = threshold
+        self.inline_calls = 0
+        self.parallel_calls = 0
+        self._pool = None
+        # Calibration measurements; None until calibrated (or configured)
+        self.calibration = None
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        # Threads do not survive fork; the child starts its own pool on demand
+        self._pool = None
+
+    @property
+    def enabled(self):
+        return self.threads > 1 and self.threshold is not None
+
+    def run(self, fn, X):
+        """Returns ``fn(X)``, computed on row chunks in parallel for large batches."""
+        n_rows = len(X)
+        if not self.enabled or n_rows < self.threshold:
+            self.inline_calls += 1
+            return fn(X)
+        return self._run_parallel(fn, X)
+
+    def _run_parallel(self, fn, X):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(self.threads, thread_name_prefix='predict')
+        self.parallel_calls += 1
+        chunks = np.array_split(X, min(self.threads, len(X)))
+        return np.concatenate(list(self._pool.map(fn, chunks)))
+
+    def wrap(self, fn):
+        """Returns ``fn`` routed through ``run``."""
+        def run(X):
+            return self.run(fn, X)
+        return run
+
+    def calibrate(self, fn, n_features, sizes=CALIBRATION_SIZES, repeat=2):
+        """
+        Sets the threshold to the smallest batch size where parallel beats
+        inline, or disables parallelism if it never does.
+
+        Args:
+            fn (callable): The batch function to measure, e.g. model.predict.
+            n_features (int): Columns of the synthetic input.
+            sizes (tuple): Batch sizes to try, increasing; stops at the first win.
+            repeat (int): Timings per size and mode; the best is kept.
+        """
+        if self.threads <= 1:
+            self.threshold = None
+            self.calibration = []
+            return self.threshold
+
+        rng = np.random.default_rng(0)
+        results = []
+        threshold = None
+        for size in sizes:
+            X = rng.standard_normal((size, n_features)).astype(np.float32)
+            inline = min(_timed(fn, X) for _ in range(repeat))
+            parallel = min(_timed(lambda X: self._run_parallel(fn, X), X) for _ in range(repeat))
+            results.append({'rows': size, 'inline_ms': inline * 1e3, 'parallel_ms': parallel * 1e3})
+            if parallel < inline * CALIBRATION_MARGIN:
+                threshold = size
+                break
+        # Stop the calibration threads, so none exist if the process forks next
+        self._pool.shutdown()
+        self._pool = None
+        self.parallel_calls = 0
+        self.threshold = threshold
+        self.calibration = results
+        log.info('Parallel threshold: %s rows on %d threads (%s)', threshold, self.threads, results)
+        return threshold
+
+    def stats(self):
+        return {
+            'threads': self.threads,
+            'threshold_rows': self.threshold,
+            'inline_calls': self.inline_calls,
+            'parallel_calls': self.parallel_calls,
+            'calibration': self.calibration,
+        }
+
+
+def _timed(fn, X):
+    start = time.perf_counter()
+    fn(X)
+    return time.perf_counter() - start
+
+
+def from_env(environ):
+    """
+    Builds an executor from PREDICT_THREADS (default: this worker's share of
+    the CPU quota, given WEB_CONCURRENCY workers) and PARALLEL_THRESHOLD
+    (rows; default: calibrated by the caller; 0 disables parallelism).
+    """
+    threads = environ.get('PREDICT_THREADS')
+    if threads:
+        threads = int(threads)
+    else:
+        threads = default_threads(int(environ.get('WEB_CONCURRENCY') or 1))
+    executor = ParallelExecutor(threads)
+    threshold = environ.get('PARALLEL_THRESHOLD')
+    if threshold not in (None, ''):
+        executor.threshold = int(threshold) or None
+        executor.calibration = 'PARALLEL_THRESHOLD'
+    return executor
@@ -0,0 +1,433 @@
+"""
+Versioned model registry with hot reload.
+
+The registry serves one *current* model version and swaps in new ones while
+the server keeps running. Versions come from either:
+
+- MODEL_DIR, a directory holding one entry per version: ``v3.forest/`` (a
+  compiled artifact), ``v3.forest.npz``, ``v3.joblib``, or a ``v3/``
+  directory containing ``model.forest`` / ``model.joblib``. The current
+  version is named by the ``CURRENT`` pointer file if there is one, else it
+  is the highest version (natural order, so v10 follows v9).
+- Otherwise the single MODEL_PATH artifact, served as version ``default``.
+
+A background thread polls for changes every ``poll_interval`` seconds (by
+default only with MODEL_DIR; see ``from_env``). A
+changed artifact is only loaded once it has stayed unchanged for one full
+poll, so half-written files are not picked up. The new version is loaded and
+warmed on that thread, then published with a single attribute assignment;
+requests already running keep the version object they started with, so
+none are dropped. Failed loads are logged and the old version keeps serving.
+
+Requests may pin a loaded or loadable version by name (``?model=v3``).
+At most ``max_loaded`` versions are kept, the current one always among
+them; evicted versions are freed once their last in-flight request drops
+its reference.
+
+Publish new versions under a new name (``publish`` does this atomically)
+rather than rewriting a served artifact in place: compiled artifacts are
+memory-mapped, and truncating a mapped file crashes its readers. To replace
+a single artifact, ``replace_artifact`` writes a new one beside it and
+renames it into place instead.
+"""
+
+from collections import OrderedDict
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from app import metrics
+from app import validation
+from app.forest import COMPILED_SUFFIX, artifact_fingerprint, find_model, load_model
+
+log = logging.getLogger('app.registry')
+
+POINTER = 'CURRENT'
+
+DEFAULT_VERSION = 'default'
+
+# Version entry suffixes, longest first
+ARTIFACT_SUFFIXES = (COMPILED_SUFFIX + '.npz', COMPILED_SUFFIX, '.joblib')
+
+
+def version_key(name):
+    """Natural sort key: 'v10' sorts after 'v9'."""
+    return [int(part) if part.isdigit() else part for part in re.split(r'(\d+)', name)]
+
+
+def signature(path):
+    """
+    A cheap change detector for an artifact: (name, size, mtime) of its file,
+    or of every file in it for a directory artifact.
+    """
+    files = [path]
+    if os.path.isdir(path):
+        files = [os.path.join(path, name) for name in sorted(os.listdir(path))]
+    result = []
+    for name in files:
+        st = os.stat(name)
+        result.append((os.path.basename(name), st.st_size, st.st_mtime_ns))
+    return tuple(result)
+
+
+def scan(model_dir):
+    """Returns {version name: artifact path} for the entries of a model directory."""
+    versions = {}
+    for entry in os.listdir(model_dir):
+        # Hidden entries are in-progress publishes
+        if entry.startswith('.') or entry == POINTER:
+            continue
+        path = os.path.join(model_dir, entry)
+        for suffix in ARTIFACT_SUFFIXES:
+            if entry.endswith(suffix):
+                versions[entry[:-len(suffix)]] = path
+                break
+        else:
+            if os.path.isdir(path):
+                found = find_model([os.path.join(path, 'model.joblib')])
+                if found is not None:
+                    versions[entry] = found
+    return versions
+
+
+def publish(forest, model_dir, version=None, make_current=True, schema=None):
+    """
+    Writes a compiled forest to ``model_dir`` as a new version, atomically.
+
+    The artifact is written under a hidden name and renamed into place, then
+    the CURRENT pointer is replaced, so a watching server never sees a
+    partial version.
+
+    Args:
+        forest (CompiledForest): The model to publish.
+        model_dir (str): The registry directory (created if missing).
+        version (str): Version name; default is one past the highest ``vN``.
+        make_current (bool): Point CURRENT at the new version.
+        schema (dict): Training feature ranges (``validation.training_ranges``),
+            written next to the artifact before it appears.
+
+    Returns:
+        str: The version name.
+    """
+    os.makedirs(model_dir, exist_ok=True)
+    if version is None:
+        numbers = [int(name[1:]) for name in scan(model_dir) if re.fullmatch(r'v\d+', name)]
+        version = 'v%d' % (max(numbers, default=0) + 1)
+    target = os.path.join(model_dir, version + COMPILED_SUFFIX)
+    if os.path.exists(target):
+        raise FileExistsError('Version %s already exists in %s' % (version, model_dir))
+
+    if schema is not None:
+        validation.write_schema(target, schema)
+
+    staging = os.path.join(model_dir, '.%s.%d.tmp' % (version, os.getpid()))
+    try:
+        forest.save(staging)
+        os.rename(staging, target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    if make_current:
+        pointer = os.path.join(model_dir, '.%s.%d.tmp' % (POINTER, os.getpid()))
+        with open(pointer, 'w') as f:
+            f.write(version + '\n')
+        os.replace(pointer, os.path.join(model_dir, POINTER))
+    return version
+
+
+def replace_artifact(forest, path, schema=None):
+    """
+    Writes a compiled forest to ``path`` without rewriting the artifact there.
+
+    The new artifact is written under a hidden name, the old one is renamed
+    aside and the new one renamed into place, then the old one is deleted.
+    Processes that have the old files mapped keep reading them intact, and a
+    reader never sees a partly written artifact (for an instant, none at all).
+
+    Args:
+        forest (CompiledForest): The model to write.
+        path (str): The artifact path, e.g. ``model.forest``.
+        schema (dict): Training feature ranges, written next to it first.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    staging = os.path.join(directory, '.%s.%d.tmp' % (name, os.getpid()))
+    old = os.path.join(directory, '.%s.%d.old' % (name, os.getpid()))
+    try:
+        forest.save(staging)
+        if schema is not None:
+            validation.write_schema(path, schema)
+        if os.path.lexists(path):
+            os.rename(path, old)
+        os.rename(staging, path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+        if os.path.isdir(old):
+            shutil.rmtree(old, ignore_errors=True)
+        elif os.path.lexists(old):
+            os.remove(old)
+
+
+class ModelVersion:
+    """
+    One loaded, warmed model version.
+
+    ``predict`` and ``predict_with_proba`` record the predict stage metrics;
+    ``fingerprint`` is the artifact's sha256, which the prediction cache is
+    bound to. ``validator`` checks input rows against the ranges the version
+    was trained on.
+    """
+
+    def __init__(self, name, path, executor=None, range_margin=validation.DEFAULT_MARGIN):
+        self.name = name
+        self.path = path
+        self.signature = signature(path)
+        start = time.perf_counter()
+        self.model = load_model(path)
+        self.warm()
+        metrics.model_load_seconds.observe(time.perf_counter() - start)
+        self.fingerprint = artifact_fingerprint(path)
+        self.validator = validation.Validator.for_artifact(path, range_margin)
+        self.loaded_at = time.time()
+        predict, predict_proba = self.model.predict, self.model.predict_proba
+        if executor is not None:
+            # Large batches are split across the executor's threads
+            predict, predict_proba = executor.wrap(predict), executor.wrap(predict_proba)
+        self.predict = metrics.timed_predict(predict)
+        self._predict_proba = metrics.timed_predict(predict_proba)
+
+    def predict_with_proba(self, features):
+        """
+        Class codes and probabilities from a single predict_proba pass.
+
+        The label is the argmax of the probabilities, exactly as the model's
+        own ``predict`` computes it, so both agree.
+
+        Returns:
+            tuple: (N,) class codes and an (N, n_classes) float32 array.
+        """
+        proba = self._predict_proba(features)
+        codes = self.model.classes_.take(np.argmax(proba, axis=1), axis=0)
+        return codes, proba.astype(np.float32)
+
+    def warm(self):
+        """Faults in the artifact's pages and runs one prediction before serving."""
+        arrays = getattr(self.model, 'arrays', None)
+        if arrays is not None:
+            for array in arrays().values():
+                np.asarray(array).sum()
+        self.model.predict(np.zeros((1, self.model.n_features_in_), dtype=np.float32))
+
+    def info(self):
+        return {'name': self.name, 'path': self.path, 'fingerprint': self.fingerprint, 'loaded_at': self.loaded_at,
+                'feature_ranges': self.validator.ranges()}
+
+
+class ModelRegistry:
+    """
+    Loads model versions and hot-swaps the current one.
+
+    Args:
+        model_dir (str): Directory of versions; None to serve ``model_path``.
+        model_path (str): The single artifact served when there is no model_dir.
+        poll_interval (float): Seconds between checks for a new version; 0
+            disables the watcher.
+        max_loaded (int): Maximum versions kept loaded, the current one included
+            (one more while a pinned version just loaded is the only other).
+        executor (ParallelExecutor): Runs every version's model calls; None for inline.
+        range_margin (float): Widening of each version's training feature
+            ranges, as a fraction of their span; negative disables range checks.
+    """
+
+    def __init__(self, model_dir=None, model_path=None, poll_interval=2.0, max_loaded=2, executor=None,
+                 range_margin=validation.DEFAULT_MARGIN):
+        if not model_dir and not model_path:
+            raise ValueError('A model_dir or a model_path is required')
+        self.model_dir = model_dir
+        self.model_path = model_path
+        self.poll_interval = float(poll_interval)
+        self.max_loaded = max(1, int(max_loaded))
+        self.executor = executor
+        self.range_margin = float(range_margin)
+        self._loaded = OrderedDict()
+        self._lock = threading.RLock()
+        self._listeners = []
+        self._thread = None
+        self._stop = threading.Event()
+        # Last observed (version, signature) of a changed artifact, and of one that failed to load
+        self._pending = None
+        self._failed = None
+        self.swaps = 0
+        self.last_error = None
+
+        name, path = self._target()
+        self.current = self._activate(ModelVersion(name, path, self.executor, self.range_margin))
+
+    def _target(self):
+        """Returns the (version name, artifact path) that should be current."""
+        if not self.model_dir:
+            return DEFAULT_VERSION, self.model_path
+        versions = scan(self.model_dir)
+        try:
+            with open(os.path.join(self.model_dir, POINTER)) as f:
+                name = f.read().strip()
+        except FileNotFoundError:
+            if not versions:
+                raise FileNotFoundError('No model versions in %s' % self.model_dir)
+            name = max(versions, key=version_key)
+        if name not in versions:
+            raise FileNotFoundError('%s points at unknown version %r' % (POINTER, name))
+        return name, versions[name]
+
+    def _path_of(self, name):
+        if not self.model_dir:
+            return self.model_path if name == DEFAULT_VERSION else None
+        return scan(self.model_dir).get(name)
+
+    def on_swap(self, listener):
+        """Registers ``listener(version)``, called just before a new version becomes current."""
+        self._listeners.append(listener)
+
+    def _activate(self, version):
+        with self._lock:
+            for listener in self._listeners:
+                listener(version)
+            self._loaded[version.name] = version
+            self._loaded.move_to_end(version.name)
+            self.current = version
+            self._evict()
+        return version
+
+    def _evict(self, keep=None):
+        """
+        Drops least recently used versions beyond max_loaded, never the current
+        one or ``keep`` (a version just loaded for a request), so max_loaded=1
+        may hold two for a while.
+        """
+        while len(self._loaded) > self.max_loaded:
+            for name, version in self._loaded.items():
+                if version is not self.current and version is not keep:
+                    # In-flight requests still hold their reference; memory
+                    # is released when the last of them finishes.
+                    del self._loaded[name]
+                    break
+            else:
+                return
+
+    def get(self, name=None):
+        """
+        Returns a loaded version: the current one, or the named one (loading
+        it on first use). Raises KeyError for an unknown version name.
+        """
+        if name is None:
+            return self.current
+        with self._lock:
+            version = self._loaded.get(name)
+            if version is not None:
+                self._loaded.move_to_end(name)
+                return version
+        path = self._path_of(name)
+        if path is None:
+            raise KeyError(name)
+        # Loaded, warmed and fingerprinted without the lock, so requests for
+        # loaded versions and hot swaps are not held up meanwhile
+        version = ModelVersion(name, path, self.executor, self.range_margin)
+        with self._lock:
+            # Another request may have loaded it first: serve that one
+            loaded = self._loaded.get(name)
+            if loaded is not None:
+                self._loaded.move_to_end(name)
+                return loaded
+            self._loaded[name] = version
+            self._evict(keep=version)
+        return version
+
+    def check(self):
+        """
+        Looks for a new current version once, loading and swapping it in if
+        its artifact has settled. Returns True if the current version changed.
+        """
+        name, path = self._target()
+        sig = signature(path)
+        current = self.current
+        if (name, sig) == (current.name, current.signature) or (name, sig) == self._failed:
+            self._pending = None
+            return False
+        if self._pending != (name, sig):
+            # Seen for the first time: wait one poll for writes to finish
+            self._pending = (name, sig)
+            return False
+        self._pending = None
+        try:
+            version = ModelVersion(name, path, self.executor, self.range_margin)
+        except Exception as e:
+            self._failed = (name, sig)
+            self.last_error = '%s: %s' % (name, e)
+            log.exception('Failed to load model version %s from %s; still serving %s', name, path, current.name)
+            return False
+        if version.fingerprint == current.fingerprint and name == current.name:
+            # Touched but unchanged
+            current.signature = sig
+            return False
+        self._activate(version)
+        self.swaps += 1
+        self.last_error = None
+        metrics.model_swaps_total.inc()
+        log.info('Model version %s (%s) is now current, replacing %s', name, path, current.name)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check()
+            except Exception as e:
+                self.last_error = str(e)
+                log.exception('Model registry check failed')
+
+    def start(self):
+        """Starts the watcher thread (once per process, after any fork)."""
+        if self.poll_interval <= 0 or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='model-registry', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            loaded = [version.info() for version in self._loaded.values()]
+        return {
+            'current': self.current.name,
+            'fingerprint': self.current.fingerprint,
+            'loaded': loaded,
+            'max_loaded': self.max_loaded,
+            'model_dir': self.model_dir,
+            'poll_interval_s': self.poll_interval,
+            'swaps': self.swaps,
+            'last_error': self.last_error,
+        }
+
+
+def from_env(environ, default_path, executor=None):
+    """
+    Builds a registry from MODEL_DIR (or MODEL_PATH), MODEL_POLL_INTERVAL,
+    MODEL_MAX_LOADED and FEATURE_RANGE_MARGIN.
+
+    The watcher polls every 2 seconds by default with MODEL_DIR, and is off
+    by default for a single MODEL_PATH, which is usually rewritten by hand.
+    """
+    model_dir = environ.get('MODEL_DIR') or None
+    return ModelRegistry(
+        model_dir=model_dir,
+        model_path=default_path,
+        poll_interval=float(environ.get('MODEL_POLL_INTERVAL', '2' if model_dir else '0')),
+        max_loaded=int(environ.get('MODEL_MAX_LOADED', '2')),
+        executor=executor,
+        range_margin=float(environ.get('FEATURE_RANGE_MARGIN', str(validation.DEFAULT_MARGIN))),
+    )
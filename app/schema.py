@@ -0,0 +1,40 @@
+"""
+Typed request bodies of the predict endpoints, for the OpenAPI schema.
+
+These models are documentation only: no request is parsed or validated
+through them. The endpoints decode bodies themselves (JSON, msgpack or raw
+float32; see app/codecs.py) and validate them with app/validation.py, which
+also reports per-row errors. The row length and the columnar field names are
+built from the same FEATURE_NAMES the Validator checks, so the documented
+forms cannot drift from what is enforced.
+"""
+
+from typing import List
+
+from pydantic import BaseModel, Field, create_model
+
+from app.validation import FEATURE_NAMES
+
+N_FEATURES = len(FEATURE_NAMES)
+
+Row = List[float]
+
+
+class PredictRequest(BaseModel):
+    features: Row = Field(min_length=N_FEATURES, max_length=N_FEATURES, examples=[[5.1, 3.5, 1.4, 0.2]])
+
+
+class BatchRequest(BaseModel):
+    instances: List[Row] = Field(min_length=1, examples=[[[5.1, 3.5, 1.4, 0.2], [6.7, 3.0, 5.2, 2.3]]])
+
+
+# One list per feature, e.g. {"sepal_length": [...], ...}
+ColumnarBatchRequest = create_model(
+    'ColumnarBatchRequest', **{name: (List[float], ...) for name in FEATURE_NAMES},
+)
+
+
+def json_schema(*models):
+    """The JSON schema of one request model, or of any of several (``anyOf``)."""
+    schemas = [model.model_json_schema() for model in models]
+    return schemas[0] if len(schemas) == 1 else {'anyOf': schemas}
@@ -0,0 +1,227 @@
+'''
+Pre-fork launcher: N uvicorn worker processes sharing one loaded model.
+
+The parent imports app.server (loading the model) and binds the listening
+socket once, then forks the workers. Every worker inherits the model pages
+copy-on-write, and a compiled .forest artifact is additionally memory-mapped,
+so its pages are shared through the page cache whatever happens after fork.
+Workers exit after --max-requests (plus jitter, so they do not all recycle at
+once) and are replaced immediately.
+
+Usage:
+    python -m app.serve --workers 16 --max-requests 100000
+'''
+
+import argparse
+import gc
+import logging
+import math
+import os
+import random
+import signal
+import socket
+import sys
+import time
+
+log = logging.getLogger('app.serve')
+
+
+def memory_usage(pid='self'):
+    """
+    Returns RSS and PSS in bytes for a process, from /proc.
+
+    PSS (proportional set size) splits shared pages between the processes
+    mapping them, so summing it over workers gives their true footprint.
+    Values are None where /proc is unavailable.
+    """
+    usage = {'rss_bytes': None, 'pss_bytes': None}
+    try:
+        with open('/proc/%s/smaps_rollup' % pid) as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if name in ('Rss', 'Pss'):
+                    usage[name.lower() + '_bytes'] = int(value.split()[0]) * 1024
+    except OSError:
+        pass
+    return usage
+
+
+def cpu_quota():
+    """
+    The container's CPU limit from cgroups (v2 cpu.max, else v1 CFS quota),
+    as a number of CPUs, or None when unlimited or unreadable.
+    """
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            return int(quota) / int(period)
+        return None
+    except (OSError, ValueError):
+        pass
+    try:
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_quota_us') as f:
+            quota = int(f.read())
+        with open('/sys/fs/cgroup/cpu/cpu.cfs_period_us') as f:
+            period = int(f.read())
+        return quota / period if quota > 0 and period > 0 else None
+    except (OSError, ValueError):
+        return None
+
+
+def cpu_count():
+    """Usable CPUs: the affinity mask, capped by the cgroup CPU quota (rounded up)."""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+    quota = cpu_quota()
+    if quota is not None:
+        count = min(count, max(1, math.ceil(quota)))
+    return count
+
+
+class Launcher:
+    """
+    Forks and supervises uvicorn workers serving a pre-imported ASGI app.
+
+    Args:
+        app: The ASGI application, already imported in the parent.
+        sock: A bound, listening socket shared by all workers.
+        workers (int): Number of worker processes.
+        max_requests (int): Recycle a worker after this many requests; 0 disables.
+        max_requests_jitter (int): Random extra requests added per worker.
+        report_interval (float): Seconds between per-worker memory reports; 0 disables.
+    """
+
+    def __init__(self, app, sock, workers, max_requests=0, max_requests_jitter=0,
+                 report_interval=0.0, log_level='info'):
+        self.app = app
+        self.sock = sock
+        self.workers = workers
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.report_interval = report_interval
+        self.log_level = log_level
+        self.children = {}
+        self.stopping = False
+
+    def spawn(self):
+        limit = None
+        if self.max_requests:
+            limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            return pid
+
+        # Worker: restore default signal handling; uvicorn installs its own.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        import uvicorn
+        config = uvicorn.Config(self.app, limit_max_requests=limit, log_level=self.log_level)
+        code = 0
+        try:
+            uvicorn.Server(config).run(sockets=[self.sock])
+        except BaseException:
+            log.exception('worker %d crashed', os.getpid())
+            code = 1
+        finally:
+            os._exit(code)
+
+    def stop(self, signum, frame):
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def report(self):
+        total_rss = total_pss = 0
+        for pid in sorted(self.children):
+            usage = memory_usage(pid)
+            total_rss += usage['rss_bytes'] or 0
+            total_pss += usage['pss_bytes'] or 0
+            log.info('worker %d rss=%.1fMiB pss=%.1fMiB', pid,
+                     (usage['rss_bytes'] or 0) / 2**20, (usage['pss_bytes'] or 0) / 2**20)
+        log.info('%d workers total rss=%.1fMiB pss=%.1fMiB', len(self.children),
+                 total_rss / 2**20, total_pss / 2**20)
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        # Objects loaded so far (the model included) are never collected;
+        # freezing them keeps the GC from touching, and so copying, their pages.
+        gc.freeze()
+        for _ in range(self.workers):
+            self.spawn()
+        log.info('Started %d workers on %s', self.workers, self.sock.getsockname())
+
+        next_report = time.monotonic() + self.report_interval
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                time.sleep(0.2)
+                if self.report_interval and time.monotonic() >= next_report:
+                    self.report()
+                    next_report = time.monotonic() + self.report_interval
+                continue
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+            if time.monotonic() - started < 1.0:
+                # Failing on startup; do not spin. uvicorn often exits with
+                # status 0 when it cannot start (bind or app load errors).
+                time.sleep(1.0)
+            log.info('worker %d exited (%d), replacing it', pid, os.waitstatus_to_exitcode(status))
+            self.spawn()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '8000')))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_CONCURRENCY', '0')) or cpu_count(),
+                        help='worker processes (default: WEB_CONCURRENCY, else one per CPU)')
+    parser.add_argument('--max-requests', type=int, default=int(os.environ.get('MAX_REQUESTS', '0')),
+                        help='recycle a worker after this many requests; 0 never')
+    parser.add_argument('--max-requests-jitter', type=int, default=int(os.environ.get('MAX_REQUESTS_JITTER', '0')))
+    parser.add_argument('--report-interval', type=float, default=float(os.environ.get('MEMORY_REPORT_INTERVAL', '0')),
+                        help='seconds between per-worker RSS/PSS log lines; 0 never')
+    parser.add_argument('--log-level', default='info')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper(), format='%(levelname)s:     [serve] %(message)s')
+
+    # Lets each worker size its prediction thread pool to its share of the CPUs
+    os.environ['WEB_CONCURRENCY'] = str(args.workers)
+
+    # Load the model once, in the parent, before any worker exists
+    from app.server import app
+
+    sock = socket.socket(socket.AF_INET6 if ':' in args.host else socket.AF_INET)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # Accepted connections inherit this; without it small responses wait on
+    # Nagle's algorithm and the client's delayed ACK, ~40ms per request.
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    sock.bind((args.host, args.port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+
+    Launcher(
+        app, sock, args.workers,
+        max_requests=args.max_requests,
+        max_requests_jitter=args.max_requests_jitter,
+        report_interval=args.report_interval,
+        log_level=args.log_level,
+    ).run()
+    sys.exit(0)
+
+
+if __name__ == '__main__':
+    main()
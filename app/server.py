@@ -1,31 +1,495 @@
-from fastapi import FastAPI
-import joblib
+import contextlib
+import os
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 import numpy as np
 
-model = joblib.load('app/model.joblib')
+from app import admission as admission_control
+from app import bulk
+from app import cache as prediction_cache
+from app import codecs
+from app import metrics
+from app import parallel
+from app import registry as model_registry
+from app import schema
+from app import shadow as shadow_evaluation
+from app.batching import MicroBatcher
+from app.forest import find_model
+from app.serve import memory_usage
+
+# MODEL_PATH may point at a joblib model or a compiled .forest artifact; by
+# default the compiled artifact is used when it sits next to the joblib file.
+# Compiled artifacts are memory-mapped, so worker processes share their pages.
+MODEL_PATH = os.environ.get('MODEL_PATH') or find_model(['app/model.joblib']) or 'app/model.joblib'
+
+# Large batches are split across a thread pool sized to this worker's CPU
+# share; the row threshold for that is measured once here, before any fork.
+executor = parallel.from_env(os.environ)
+
+# The current model version, hot-swapped when MODEL_DIR (or MODEL_PATH)
+# changes; see app/registry.py. Loaded here, before any worker fork.
+registry = model_registry.from_env(os.environ, MODEL_PATH, executor)
+if executor.calibration is None:
+    executor.calibrate(registry.current.model.predict_proba, registry.current.model.n_features_in_)
+
+# Repeated feature rows are answered from memory; see CACHE_* in the readme.
+# The cache follows the current version and is cleared when it is swapped.
+cache = prediction_cache.from_env(os.environ)
+cache.bind(registry.current.fingerprint)
+registry.on_swap(lambda version: cache.bind(version.fingerprint))
+
+
+def predict_current(features):
+    """
+    Scores a micro-batch with whichever version is current when it runs.
+
+    Returns one (class code, probabilities) pair per row, both from the same
+    predict_proba pass, so /predict can answer with or without scores.
+    """
+    codes, proba = registry.current.predict_with_proba(features)
+    return list(zip(codes.tolist(), proba))
 
 class_names = np.array(['setosa', 'versicolor', 'virginica'])
 
-app = FastAPI()
+# Column names accepted by the columnar form of /predict/batch, in model order
+feature_names = list(schema.FEATURE_NAMES)
+
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '10000'))
+
+# Rows per model call when scoring a /predict/stream body
+STREAM_CHUNK_SIZE = int(os.environ.get('STREAM_CHUNK_SIZE', str(bulk.DEFAULT_CHUNK_SIZE)))
+
+# Longest /predict/stream line buffered while waiting for its newline
+MAX_LINE_BYTES = int(os.environ.get('MAX_LINE_BYTES', '65536'))
+
+# Single-row /predict calls are coalesced into batches of up to
+# BATCHER_MAX_SIZE rows, waiting at most BATCHER_MAX_WAIT_MS for company.
+batcher = MicroBatcher(
+    predict_current,
+    max_batch_size=int(os.environ.get('BATCHER_MAX_SIZE', '32')),
+    max_wait=float(os.environ.get('BATCHER_MAX_WAIT_MS', '2')) / 1000.0,
+)
+
+# At most MAX_IN_FLIGHT requests per worker are processed at once; up to
+# MAX_QUEUE more wait (QUEUE_TIMEOUT_MS at most), the rest are shed at once.
+# Streams are long-lived and are not counted.
+admission = admission_control.from_env(os.environ)
+
+# With SHADOW_MODEL_PATH set, a sample of requests is also scored by that
+# candidate in the background, and CANARY_PERCENT of them are answered by it;
+# see app/shadow.py. Shadow sampling pauses while requests are queued above.
+shadow = shadow_evaluation.from_env(os.environ, registry.range_margin, busy=lambda: admission.queue_depth > 0)
+
+# Scored once per worker at startup; /ready reports ready only after it
+WARMUP_ROW = np.array([5.1, 3.5, 1.4, 0.2], dtype=np.float32)
+
+# Set once this worker's warm-up prediction has succeeded
+ready = False
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    """Starts this worker's background threads and warms it up; stops the threads on shutdown."""
+    global ready
+    # Runs in every worker, so each one watches for new versions itself
+    registry.start()
+    try:
+        # Through the micro-batcher, so its thread and this worker's event loop
+        # are exercised along with the model before traffic is accepted
+        await batcher.submit(WARMUP_ROW)
+        ready = True
+        shadow.start()
+        yield
+    finally:
+        registry.stop()
+        shadow.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(admission_control.AdmissionMiddleware, controller=admission, paths=['/predict', '/predict/batch'])
+# Added last, so it is outermost and also counts the requests shed above
+app.add_middleware(metrics.MetricsMiddleware, paths=['/predict', '/predict/batch', '/predict/stream'])
+app.add_exception_handler(admission_control.Overloaded, lambda request, exc: admission_control.shed_response(exc))
+
+# Query parameters of the predict endpoints, for the OpenAPI schema (the
+# endpoints read them from the request themselves)
+PREDICT_PARAMETERS = [
+    {'name': 'model', 'in': 'query', 'required': False, 'schema': {'type': 'string'},
+     'description': 'Model version to use (default: the current one)'},
+    {'name': 'proba', 'in': 'query', 'required': False, 'schema': {'type': 'boolean'},
+     'description': 'Also return the class probabilities'},
+    {'name': 'top_k', 'in': 'query', 'required': False, 'schema': {'type': 'integer', 'minimum': 1},
+     'description': 'Also return the k most likely classes with their scores'},
+]
+
+
+class LineTooLong(Exception):
+    """A /predict/stream line outgrew MAX_LINE_BYTES before its newline arrived."""
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    A StreamingResponse that can keep reading the request body while it streams.
+
+    On servers speaking ASGI spec < 2.4 (uvicorn included), StreamingResponse
+    concurrently awaits ``receive`` to spot disconnects, which would swallow
+    request body chunks. Disconnects still surface here, from the body stream
+    or from ``send``.
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+async def model_version(request):
+    """
+    Returns the version pinned with ``?model=<name>``, else the current one,
+    or for the CANARY_PERCENT share of unpinned requests the candidate.
+
+    A version that is not loaded yet is loaded (off the event loop) on first use.
+    """
+    name = request.query_params.get('model')
+    if name is None and shadow.canary():
+        return shadow.candidate
+    if name is None or name == registry.current.name:
+        return registry.current
+    try:
+        return await run_in_threadpool(registry.get, name)
+    except KeyError:
+        raise HTTPException(status_code=404, detail='Unknown model version %r' % name)
+
+
+def probability_options(request):
+    """Returns (include_proba, top_k) from the ``proba`` and ``top_k`` query parameters."""
+    include_proba = request.query_params.get('proba', '').lower() in ('1', 'true', 'yes')
+    top_k = request.query_params.get('top_k')
+    if top_k is None:
+        return include_proba, 0
+    try:
+        top_k = int(top_k)
+    except ValueError:
+        top_k = 0
+    if not 1 <= top_k <= len(class_names):
+        raise HTTPException(status_code=422, detail='top_k must be between 1 and %d' % len(class_names))
+    return include_proba, top_k
+
+
+def batch_rows(data):
+    """
+    Returns the feature rows of a batch payload, unvalidated.
+
+    Accepts either row-major {"instances": [[f1, f2, f3, f4], ...]} or a
+    columnar payload {"sepal_length": [...], "sepal_width": [...], ...}.
+    A malformed envelope or an oversized batch raises a 4xx error; the rows
+    themselves are checked by the model version's validator.
+    """
+    if 'instances' in data:
+        rows = data['instances']
+    elif all(name in data for name in feature_names):
+        columns = [data[name] for name in feature_names]
+        if not all(isinstance(c, list) for c in columns):
+            raise HTTPException(status_code=422, detail='Columns must be lists')
+        if len({len(c) for c in columns}) != 1:
+            raise HTTPException(status_code=422, detail='Columns must have equal length')
+        rows = list(zip(*columns))
+    else:
+        raise HTTPException(
+            status_code=422,
+            detail='Expected "instances" or the columns %s' % ', '.join(feature_names),
+        )
+
+    if not isinstance(rows, (list, tuple)) or len(rows) == 0:
+        raise HTTPException(status_code=422, detail='Batch must be a non-empty list')
+    if len(rows) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail='Batch of %d rows exceeds the limit of %d' % (len(rows), MAX_BATCH_SIZE),
+        )
+    return rows
+
+
+def score_valid(predict, checked):
+    """
+    Scores the rows that passed validation only.
+
+    Returns:
+        A class code per row, -1 for the rows that failed.
+    """
+    if checked.all_valid:
+        return predict(checked.features)
+    codes = np.full(len(checked.valid), -1, dtype=np.int64)
+    if checked.valid.any():
+        codes[checked.valid] = predict(checked.features[checked.valid])
+    return codes
+
+
+def score_valid_with_proba(version, checked):
+    """Like score_valid, with probabilities (NaN for the rows that failed)."""
+    if checked.all_valid:
+        return version.predict_with_proba(checked.features)
+    codes = np.full(len(checked.valid), -1, dtype=np.int64)
+    proba = np.full((len(checked.valid), len(class_names)), np.nan, dtype=np.float32)
+    if checked.valid.any():
+        codes[checked.valid], proba[checked.valid] = version.predict_with_proba(checked.features[checked.valid])
+    return codes, proba
+
 
 @app.get('/')
 def read_root():
     return {'message': 'Iris model API'}
 
-@app.post('/predict')
-def predict(data: dict):
+@app.post('/predict', openapi_extra={
+    **codecs.openapi_body({'features': [5.1, 3.5, 1.4, 0.2]}, schema.json_schema(schema.PredictRequest)),
+    'parameters': PREDICT_PARAMETERS})
+async def predict(request: Request):
     """
     Predicts the class of a given set of features.
 
-    Args:
-        data (dict): A dictionary containing the features to predict.
-        e.g. {"features": [1, 2, 3, 4]}
+    The body is JSON (default) or msgpack, e.g. {"features": [1, 2, 3, 4]},
+    or 16 bytes of little-endian float32 (application/octet-stream). See
+    app/codecs.py for the response types selectable with Accept.
+
+    With ?proba=true the class probabilities are added, and with ?top_k=k
+    the k most likely classes with their scores; both come from the same
+    predict_proba pass as the label.
+
+    Features that are not finite numbers, or lie well outside the model's
+    training ranges, are rejected with a 422 before any scoring.
+
+    Under overload the request may be shed before its body is read (see
+    app/admission.py): 429 when the wait queue is full, 503 when it waited
+    too long or the client's X-Request-Timeout-Ms budget ran out.
 
     Returns:
         dict: A dictionary containing the predicted class.
-    """        
-    features = np.array(data['features']).reshape(1, -1)
-    prediction = model.predict(features)
-    class_name = class_names[prediction][0]
-    return {'predicted_class': class_name}
+    """
+    version = await model_version(request)
+    include_proba, top_k = probability_options(request)
+    body = await request.body()
+    timer = metrics.StageTimer()
+    data = codecs.decode(body, request.headers.get('content-type'), len(feature_names))
+    timer.lap('parse')
+    if isinstance(data, dict):
+        if 'features' not in data:
+            raise HTTPException(status_code=422, detail='Missing "features"')
+        rows = [data['features']]
+    elif len(data) != 1:
+        raise HTTPException(status_code=422, detail='Expected a single row of %d features' % len(feature_names))
+    else:
+        rows = data
+    checked = version.validator.validate(rows)
+    if not checked.all_valid:
+        raise HTTPException(status_code=422, detail='"features": %s' % checked.errors[0]['error'])
+    features = checked.features[0]
+    timer.lap('validate')
+    # The model call itself is recorded as 'predict' by the version; here the
+    # time waiting for the micro-batch (cache lookups included) is recorded.
+    proba = None
+    if version is not registry.current:
+        # Pinned to an older or newer version: scored on its own, uncached
+        codes, probas = await admission.within(
+            run_in_threadpool(version.predict_with_proba, features[np.newaxis, :]),
+            admission_control.request_deadline(request))
+        prediction, proba = codes[0], probas[0]
+        timer.skip()
+    else:
+        key = cache.keys(features[np.newaxis, :])[0] if cache.enabled else None
+        # The cache holds labels only, so requests for scores go to the model
+        prediction = None
+        if key is not None and not (include_proba or top_k):
+            prediction = cache.get_many([key])[0]
+        if prediction is None:
+            # Past the client's deadline its row is dropped from the micro-batch
+            prediction, proba = await admission.within(
+                batcher.submit(features), admission_control.request_deadline(request))
+            if key is not None:
+                # Not stored if a reload swapped the model meanwhile
+                cache.put_many([key], [int(prediction)], version.fingerprint)
+        timer.lap('batch_wait')
+        # Queued for the shadow thread, if sampled; scored after the response
+        shadow.offer(version, features[np.newaxis, :], [prediction])
+    metrics.count_predictions([prediction], class_names)
+    response = codecs.encode(prediction, class_names, request.headers.get('accept'), 'predicted_class',
+                             proba=proba, include_proba=include_proba, top_k=top_k)
+    timer.lap('encode')
+    return response
+
+@app.post('/predict/batch', openapi_extra={
+    **codecs.openapi_body({'instances': [[5.1, 3.5, 1.4, 0.2]]},
+                          schema.json_schema(schema.BatchRequest, schema.ColumnarBatchRequest)),
+    'parameters': PREDICT_PARAMETERS})
+async def predict_batch(request: Request):
+    """
+    Predicts the classes of a batch of feature rows with a single model call.
+
+    The body is either {"instances": [[1, 2, 3, 4], ...]} or a columnar
+    payload {"sepal_length": [...], "sepal_width": [...], "petal_length":
+    [...], "petal_width": [...]}, as JSON (default) or msgpack; or N x 4
+    little-endian float32 values (application/octet-stream), which skip
+    parsing entirely. With Accept: application/octet-stream the response is
+    one int8 class code per row.
+
+    ?proba=true adds the probabilities (a dense N x 3 float32 block with
+    Accept: application/octet-stream) and ?top_k=k the k most likely
+    classes per row, from the same predict_proba pass as the labels.
+
+    Rows are validated together (see app/validation.py) and only the valid
+    ones are scored. Invalid rows get null entries and are listed in
+    "errors" as {"index": i, "error": ...}; in binary responses their class
+    code is -1 and their probabilities NaN.
+
+    Admission control and X-Request-Timeout-Ms apply as for /predict.
+
+    Returns:
+        dict: A dictionary containing the predicted classes, in input order.
+    """
+    version = await model_version(request)
+    include_proba, top_k = probability_options(request)
+    body = await request.body()
+    timer = metrics.StageTimer()
+    data = codecs.decode(body, request.headers.get('content-type'), len(feature_names))
+    timer.lap('parse')
+    if isinstance(data, dict):
+        rows = batch_rows(data)
+        timer.lap('to_array')
+    else:
+        rows = data
+        if len(rows) > MAX_BATCH_SIZE:
+            raise HTTPException(
+                status_code=413,
+                detail='Batch of %d rows exceeds the limit of %d' % (len(rows), MAX_BATCH_SIZE),
+            )
+    checked = version.validator.validate(rows)
+    timer.lap('validate')
+    # Past the client's deadline the request stops waiting (503); the thread
+    # finishes the batch it started, but nobody waits for the result
+    deadline = admission_control.request_deadline(request)
+    proba = None
+    if include_proba or top_k:
+        predictions, proba = await admission.within(
+            run_in_threadpool(score_valid_with_proba, version, checked), deadline)
+    elif version is registry.current:
+        predictions = await admission.within(run_in_threadpool(
+            score_valid, lambda features: cache.predict(version.predict, features, version.fingerprint), checked),
+            deadline)
+    else:
+        predictions = await admission.within(run_in_threadpool(score_valid, version.predict, checked), deadline)
+    timer.skip()
+    served = np.asarray(predictions)[checked.valid]
+    if version is registry.current:
+        shadow.offer(version, checked.features[checked.valid], served)
+    metrics.count_predictions(served, class_names)
+    response = codecs.encode(predictions, class_names, request.headers.get('accept'), 'predicted_classes',
+                             proba=proba, include_proba=include_proba, top_k=top_k, errors=checked.errors)
+    timer.lap('encode')
+    return response
+
+@app.post('/predict/stream')
+async def predict_stream(request: Request):
+    """
+    Scores an NDJSON request body and streams NDJSON results back.
+
+    Each input line is {"features": [1, 2, 3, 4]} (or a bare [1, 2, 3, 4]).
+    Lines are scored in chunks of STREAM_CHUNK_SIZE rows as the body arrives,
+    so memory stays constant for arbitrarily large inputs. Each input line
+    yields one output line, in order: {"predicted_class": ...}, or
+    {"error": ...} for a line that could not be parsed or failed validation.
+
+    Clients must read the response while still sending the body (curl does);
+    for very large offline jobs use score.py instead of HTTP. The whole
+    stream is scored by one model version, even across a reload.
+
+    A line longer than MAX_LINE_BYTES ends the stream: the lines before it
+    are answered, then a final {"error": ..., "status": 413} line is sent
+    and the rest of the body is not read. (The 200 status has already gone
+    out by then, so the error is reported in the body.)
+    """
+    version = await model_version(request)
+
+    async def lines():
+        pending = b''
+        async for data in request.stream():
+            pending += data
+            *complete, pending = pending.split(b'\n')
+            for line in complete:
+                if len(line) > MAX_LINE_BYTES:
+                    raise LineTooLong()
+                yield line
+            if len(pending) > MAX_LINE_BYTES:
+                raise LineTooLong()
+        if pending:
+            yield pending
+
+    async def results():
+        chunk = []
+        try:
+            async for line in lines():
+                if not line.strip():
+                    continue
+                chunk.append(bulk.parse_entry(bulk.parse_json_row, line))
+                if len(chunk) >= STREAM_CHUNK_SIZE:
+                    scored = await run_in_threadpool(bulk.score_chunk, version.predict, chunk, class_names, version.validator)
+                    yield bulk.encode_ndjson(scored)
+                    chunk = []
+        except LineTooLong:
+            too_long = True
+        else:
+            too_long = False
+        if chunk:
+            scored = await run_in_threadpool(bulk.score_chunk, version.predict, chunk, class_names, version.validator)
+            yield bulk.encode_ndjson(scored)
+        if too_long:
+            yield bulk.encode_ndjson([{'error': 'Line exceeds %d bytes' % MAX_LINE_BYTES, 'status': 413}])
+
+    return DuplexStreamingResponse(results(), media_type='application/x-ndjson')
+
+@app.get('/ready')
+def readiness():
+    """Readiness probe: 200 once this worker has served its warm-up prediction, 503 before."""
+    if not ready:
+        return JSONResponse({'status': 'starting'}, status_code=503)
+    return {'status': 'ready', 'model': registry.current.name}
+
+@app.get('/stats/admission')
+def admission_stats():
+    """Reports in-flight requests, queue depth and wait, and requests shed by reason."""
+    return admission.stats()
+
+@app.get('/stats/shadow')
+def shadow_stats():
+    """Reports the candidate model's agreement with the primary, latency per row of both, and canary counts."""
+    return shadow.stats()
+
+@app.get('/stats/batcher')
+def batcher_stats():
+    """Reports the micro-batcher's queue depth and realized batch sizes."""
+    return batcher.stats()
+
+@app.get('/stats/cache')
+def cache_stats():
+    """Reports prediction cache size and hit/miss/eviction counters."""
+    return cache.stats()
+
+@app.get('/stats/models')
+def model_stats():
+    """Reports the current model version, the loaded versions and reload status."""
+    return registry.stats()
+
+@app.get('/stats/parallel')
+def parallel_stats():
+    """Reports the prediction thread pool size, the calibrated row threshold and call counts."""
+    return executor.stats()
+
+@app.get('/stats/worker')
+def worker_stats():
+    """Reports this worker process's pid and memory (RSS, and PSS which splits shared pages)."""
+    return {'pid': os.getpid(), **memory_usage()}
 
+@app.get('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this worker process: stage latencies, outcomes, predicted classes."""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
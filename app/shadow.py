@@ -0,0 +1,262 @@
+"""
+Shadow and canary evaluation of a candidate model next to the primary.
+
+A candidate artifact (SHADOW_MODEL_PATH, e.g. a retrain from save_model.py)
+is loaded beside the current version. Two modes, usable together:
+
+- Shadow: a sample of the requests the primary answers is also scored by
+  the candidate, on a background thread after the response is decided. The
+  thread compares the candidate's labels with what the primary served.
+  Labels need no second primary call; to compare latencies like for like, a
+  sample of batches (``timing_rate``) is re-scored by the primary and both
+  models are timed on the same rows, so that extra CPU is a fraction of the
+  shadow work. Requests only enqueue their rows; the queue is bounded and
+  drops what does not fit, and nothing is sampled while admission control
+  has requests waiting. The thread runs at the lowest CPU priority and
+  scores in batches, so the primary's tail latency does not pay for it.
+- Canary: a fraction of requests is answered by the candidate itself,
+  uncached, as if pinned with ``?model=``.
+
+Agreement counts, a primary x candidate label matrix and per-row latencies
+are reported by ``stats`` and as Prometheus metrics.
+"""
+
+from collections import deque
+import logging
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+from app import metrics
+from app import validation
+from app.registry import ModelVersion
+
+log = logging.getLogger('app.shadow')
+
+shadow_rows_total = metrics.registry.counter(
+    'iris_shadow_rows_total', 'Rows offered to the shadow model, by outcome (agree, disagree, dropped).',
+    labels=('outcome',),
+)
+shadow_seconds = metrics.registry.histogram(
+    'iris_shadow_batch_seconds', 'Time to score one shadow batch, by model (primary, candidate).',
+    labels=('model',),
+)
+canary_requests_total = metrics.registry.counter(
+    'iris_canary_requests_total', 'Requests answered by the canary (candidate) model.',
+)
+
+
+class ShadowEvaluator:
+    """
+    Scores sampled traffic with a candidate model off the response path.
+
+    Args:
+        candidate (ModelVersion): The candidate; None disables shadow and canary.
+        sample_rate (float): Fraction of primary-served requests shadowed.
+        canary_percent (float): Percentage of requests answered by the candidate.
+        max_queue_rows (int): Rows waiting for the shadow thread; more are dropped.
+        max_batch_rows (int): Rows per shadow scoring pass.
+        max_wait (float): Seconds the thread waits to fill a batch.
+        busy (callable): Returns True while the server is overloaded; nothing
+            is sampled then.
+        timing_rate (float): Fraction of shadow batches the primary re-scores
+            to compare latencies on the same rows; 0 never re-scores.
+    """
+
+    def __init__(self, candidate=None, sample_rate=0.05, canary_percent=0.0, max_queue_rows=4096,
+                 max_batch_rows=512, max_wait=0.05, busy=None, timing_rate=0.1):
+        self.candidate = candidate
+        self.sample_rate = min(1.0, max(0.0, float(sample_rate)))
+        self.canary_fraction = min(1.0, max(0.0, float(canary_percent) / 100.0))
+        self.max_queue_rows = max(1, int(max_queue_rows))
+        self.max_batch_rows = max(1, int(max_batch_rows))
+        self.max_wait = max(0.0, float(max_wait))
+        self.busy = busy
+        self.timing_rate = min(1.0, max(0.0, float(timing_rate)))
+        # (primary version, features, primary class codes) per sampled request
+        self._queue = deque()
+        self._queued_rows = 0
+        self._ready = threading.Condition()
+        self._thread = None
+        self._stop = threading.Event()
+        n_classes = len(candidate.model.classes_) if candidate is not None else 0
+        self._labels = np.zeros((n_classes, n_classes), dtype=np.int64)
+        self.compared = 0
+        self.agreed = 0
+        self.dropped = 0
+        self.batches = 0
+        self.canary_requests = 0
+        # Rows of the batches both models were timed on, and their times
+        self._timed_rows = 0
+        self._primary_seconds = 0.0
+        self._candidate_seconds = 0.0
+
+    @property
+    def enabled(self):
+        return self.candidate is not None
+
+    def canary(self):
+        """Decides whether this request is answered by the candidate."""
+        if self.candidate is None or not self.canary_fraction or random.random() >= self.canary_fraction:
+            return False
+        self.canary_requests += 1
+        canary_requests_total.inc()
+        return True
+
+    def offer(self, primary, features, codes):
+        """
+        Samples a request the primary answered for shadow scoring.
+
+        Only queues the rows: returns at once, whether they are taken or not.
+
+        Args:
+            primary (ModelVersion): The version that served the request.
+            features (np.ndarray): The (N, F) float32 rows it scored.
+            codes: Its N class codes.
+        """
+        if self.candidate is None or not self.sample_rate or random.random() >= self.sample_rate:
+            return
+        n = len(features)
+        if n == 0:
+            return
+        if (self.busy is not None and self.busy()) or self._queued_rows + n > self.max_queue_rows:
+            self.dropped += n
+            shadow_rows_total.inc('dropped', amount=n)
+            return
+        with self._ready:
+            self._queue.append((primary, features, np.asarray(codes, dtype=np.int64)))
+            self._queued_rows += n
+            self._ready.notify()
+
+    def _take(self):
+        """Waits for rows, then up to max_wait for a full batch; returns the queued items taken."""
+        with self._ready:
+            while not self._queue and not self._stop.is_set():
+                self._ready.wait(1.0)
+            deadline = time.monotonic() + self.max_wait
+            while self._queued_rows < self.max_batch_rows and not self._stop.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._ready.wait(remaining)
+            items, rows = [], 0
+            while self._queue and (not items or rows + len(self._queue[0][1]) <= self.max_batch_rows):
+                item = self._queue.popleft()
+                items.append(item)
+                rows += len(item[1])
+            self._queued_rows -= rows
+        return items
+
+    def _score(self, primary, features, codes):
+        # The primary's labels are already known; it only runs again to be timed
+        primary_seconds = None
+        if self.timing_rate and random.random() < self.timing_rate:
+            start = time.perf_counter()
+            primary.model.predict(features)
+            primary_seconds = time.perf_counter() - start
+            shadow_seconds.observe(primary_seconds, 'primary')
+        start = time.perf_counter()
+        candidate_codes = self.candidate.model.predict(features)
+        candidate_seconds = time.perf_counter() - start
+        shadow_seconds.observe(candidate_seconds, 'candidate')
+
+        candidate_codes = np.asarray(candidate_codes, dtype=np.int64)
+        agreed = int(np.count_nonzero(candidate_codes == codes))
+        np.add.at(self._labels, (codes, candidate_codes), 1)
+        self.compared += len(codes)
+        self.agreed += agreed
+        self.batches += 1
+        if primary_seconds is not None:
+            self._timed_rows += len(codes)
+            self._primary_seconds += primary_seconds
+            self._candidate_seconds += candidate_seconds
+        shadow_rows_total.inc('agree', amount=agreed)
+        shadow_rows_total.inc('disagree', amount=len(codes) - agreed)
+
+    def _run(self):
+        try:
+            # Lowest priority for this thread only (Linux takes a thread id here)
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except (AttributeError, OSError):
+            pass
+        while not self._stop.is_set():
+            items = self._take()
+            # One pass per primary version, in case a reload happened meanwhile
+            by_primary = {}
+            for primary, features, codes in items:
+                group = by_primary.setdefault(id(primary), (primary, [], []))
+                group[1].append(features)
+                group[2].append(codes)
+            for primary, features, codes in by_primary.values():
+                try:
+                    self._score(primary, np.concatenate(features), np.concatenate(codes))
+                except Exception:
+                    log.exception('Shadow scoring failed')
+
+    def start(self):
+        """Starts the shadow thread (once per process, after any fork)."""
+        if self.candidate is None or not self.sample_rate or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='shadow', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        with self._ready:
+            self._ready.notify()
+
+    def stats(self):
+        """
+        Returns agreement, latency per row of both models, the label matrix and drop counts.
+
+        Latencies come from the batches both models were timed on (``timed_rows``).
+        """
+        if self.candidate is None:
+            return {'enabled': False}
+        timed = self._timed_rows
+        primary_us = self._primary_seconds / timed * 1e6 if timed else 0.0
+        candidate_us = self._candidate_seconds / timed * 1e6 if timed else 0.0
+        return {
+            'enabled': True,
+            'candidate': self.candidate.info(),
+            'sample_rate': self.sample_rate,
+            'timing_rate': self.timing_rate,
+            'canary_percent': self.canary_fraction * 100.0,
+            'canary_requests': self.canary_requests,
+            'compared_rows': self.compared,
+            'agreement_rate': self.agreed / self.compared if self.compared else None,
+            # Rows: the primary's label; columns: the candidate's
+            'label_matrix': self._labels.tolist(),
+            'primary_us_per_row': primary_us,
+            'candidate_us_per_row': candidate_us,
+            'latency_delta_us_per_row': candidate_us - primary_us,
+            'timed_rows': timed,
+            'batches': self.batches,
+            'queued_rows': self._queued_rows,
+            'dropped_rows': self.dropped,
+        }
+
+
+def from_env(environ, range_margin=validation.DEFAULT_MARGIN, busy=None):
+    """
+    Builds an evaluator from SHADOW_MODEL_PATH (unset: disabled),
+    SHADOW_SAMPLE_RATE, CANARY_PERCENT, SHADOW_MAX_QUEUE_ROWS and
+    SHADOW_TIMING_RATE.
+    """
+    path = environ.get('SHADOW_MODEL_PATH')
+    candidate = None
+    if path:
+        candidate = ModelVersion('candidate', path, range_margin=range_margin)
+        log.info('Candidate model %s loaded for shadow/canary evaluation', path)
+    return ShadowEvaluator(
+        candidate,
+        sample_rate=float(environ.get('SHADOW_SAMPLE_RATE', '0.05')),
+        canary_percent=float(environ.get('CANARY_PERCENT', '0')),
+        max_queue_rows=int(environ.get('SHADOW_MAX_QUEUE_ROWS', '4096')),
+        busy=busy,
+        timing_rate=float(environ.get('SHADOW_TIMING_RATE', '0.1')),
+    )
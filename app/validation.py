@@ -0,0 +1,208 @@
+"""
+Vectorized feature validation, shared by app/server.py and api/predict.py.
+
+``Validator`` checks shape, dtype, finiteness and per-feature ranges for a
+whole batch in a few numpy passes, and only walks individual rows to
+describe the ones that failed. Invalid rows are reported by index, so a
+batch can still score its valid rows.
+
+Feature ranges come from the training data: ``save_model.py`` writes them to
+a ``<model>.schema.json`` file next to the artifact, e.g.
+``app/model.schema.json`` for ``app/model.forest``. Rows outside the range,
+widened on both sides by ``margin`` times the feature's training span, are
+rejected as out of distribution. Without that file only shape, dtype and
+finiteness are checked.
+
+Only numpy is needed, so the serverless function can use it cheaply.
+"""
+
+import json
+import os
+
+import numpy as np
+
+FEATURE_NAMES = ('sepal_length', 'sepal_width', 'petal_length', 'petal_width')
+
+SCHEMA_SUFFIX = '.schema.json'
+
+# Artifact suffixes stripped to find the schema file, longest first
+_ARTIFACT_SUFFIXES = ('.forest.npz', '.forest', '.joblib')
+
+# Default widening of the training ranges, as a fraction of each feature's span
+DEFAULT_MARGIN = 0.1
+
+
+def schema_path(artifact_path):
+    """Returns the feature schema file that belongs to a model artifact."""
+    path = artifact_path.rstrip(os.sep)
+    for suffix in _ARTIFACT_SUFFIXES:
+        if path.endswith(suffix):
+            return path[:-len(suffix)] + SCHEMA_SUFFIX
+    return path + SCHEMA_SUFFIX
+
+
+def training_ranges(X, feature_names=FEATURE_NAMES):
+    """The schema file contents for training features X."""
+    X = np.asarray(X, dtype=np.float64)
+    return {'feature_names': list(feature_names), 'min': X.min(axis=0).tolist(), 'max': X.max(axis=0).tolist()}
+
+
+def write_schema(artifact_path, schema):
+    """Writes ``schema`` (see training_ranges) next to an artifact, atomically."""
+    path = schema_path(artifact_path)
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'w') as f:
+        json.dump(schema, f, indent=2)
+        f.write('\n')
+    os.replace(tmp, path)
+
+
+class Validation:
+    """
+    The result of validating a batch.
+
+    Attributes:
+        features: (N, F) float32 array; rows that failed hold arbitrary values.
+        valid: (N,) bool mask of rows that passed.
+        errors: [{"index": i, "error": message}] for the rows that failed, by index.
+    """
+
+    def __init__(self, features, valid, errors):
+        self.features = features
+        self.valid = valid
+        self.errors = errors
+
+    @property
+    def all_valid(self):
+        return not self.errors
+
+
+class Validator:
+    """
+    Vectorized checks for feature rows.
+
+    Args:
+        feature_names (sequence): Column names, in model order.
+        lower, upper (sequence): Inclusive per-feature bounds, or None for no range check.
+    """
+
+    def __init__(self, feature_names=FEATURE_NAMES, lower=None, upper=None):
+        self.feature_names = tuple(feature_names)
+        self.n_features = len(self.feature_names)
+        self.lower = None if lower is None else np.asarray(lower, dtype=np.float32)
+        self.upper = None if upper is None else np.asarray(upper, dtype=np.float32)
+
+    @classmethod
+    def for_artifact(cls, artifact_path, margin=DEFAULT_MARGIN):
+        """
+        Builds the validator for a model artifact, with the training ranges
+        from its schema file widened by ``margin``; a negative margin, or a
+        missing file, disables the range check.
+        """
+        try:
+            with open(schema_path(artifact_path)) as f:
+                schema = json.load(f)
+        except FileNotFoundError:
+            return cls()
+        if margin < 0:
+            return cls(schema['feature_names'])
+        low = np.asarray(schema['min'], dtype=np.float64)
+        high = np.asarray(schema['max'], dtype=np.float64)
+        span = high - low
+        return cls(schema['feature_names'], low - margin * span, high + margin * span)
+
+    def ranges(self):
+        if self.lower is None:
+            return None
+        # Rounded to float32 precision, to report 4.3 rather than 4.300000190734863
+        return {name: [round(float(lo), 6), round(float(hi), 6)]
+                for name, lo, hi in zip(self.feature_names, self.lower, self.upper)}
+
+    def _row_error(self, row):
+        """Describes why one raw row cannot be converted (slow path)."""
+        if not isinstance(row, (list, tuple)) or len(row) != self.n_features:
+            return 'expected %d features' % self.n_features
+        for name, value in zip(self.feature_names, row):
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                return '%s must be a number' % name
+        return None
+
+    def to_array(self, rows):
+        """
+        Converts raw rows (lists of numbers, or an array) into an (N, F)
+        float32 array, plus {index: message} for rows that could not be.
+
+        Well-formed input is converted in one numpy call; rows are only
+        inspected one by one when that fails, or when a row holds a bool.
+        """
+        try:
+            raw = np.asarray(rows)
+        except (TypeError, ValueError):
+            # Ragged nesting
+            raw = None
+        if raw is not None and raw.ndim == 2 and raw.dtype.kind in 'iuf' and not isinstance(rows, np.ndarray):
+            # numpy silently turns a bool next to numbers into 0 or 1: those
+            # rows are looked at for one, and bools are rejected below
+            suspects = np.flatnonzero(((raw == 0) | (raw == 1)).any(axis=1))
+            if any(type(value) is bool for i in suspects.tolist() for value in rows[i]):
+                raw = None
+        if raw is not None and raw.ndim == 2 and raw.shape[1] == self.n_features and raw.dtype.kind in 'iuf':
+            # Values beyond float32 become inf and fail the finiteness check
+            return raw.astype(np.float32, copy=False), {}
+        if raw is not None and raw.ndim == 2 and raw.shape[1] != self.n_features and raw.dtype.kind in 'iuf':
+            # Every row has the same wrong length
+            return np.zeros((len(raw), self.n_features), dtype=np.float32), {
+                i: 'expected %d features' % self.n_features for i in range(len(raw))}
+
+        features = np.zeros((len(rows), self.n_features), dtype=np.float32)
+        errors = {}
+        for i, row in enumerate(rows):
+            error = self._row_error(row)
+            if error is None:
+                try:
+                    features[i] = row
+                except OverflowError:
+                    error = 'features must fit in float32'
+            if error is not None:
+                errors[i] = error
+        return features, errors
+
+    def check(self, features):
+        """
+        Checks finiteness and ranges of an (N, F) float32 array.
+
+        Returns:
+            dict: {index: message} for the rows that fail.
+        """
+        if self.lower is not None:
+            # NaN compares false, and +-inf lies outside any finite range
+            ok = (features >= self.lower) & (features <= self.upper)
+        else:
+            ok = np.isfinite(features)
+        if ok.all():
+            return {}
+        bad = ~np.isfinite(features)
+        out_of_range = ~ok & ~bad
+        failed = np.flatnonzero(~ok.all(axis=1))
+        errors = {}
+        for i in failed.tolist():
+            column = int(np.argmax(bad[i] | out_of_range[i]))
+            name = self.feature_names[column]
+            if bad[i, column]:
+                errors[i] = '%s must be finite' % name
+            else:
+                errors[i] = '%s=%g is outside the expected range [%g, %g]' % (
+                    name, features[i, column], self.lower[column], self.upper[column])
+        return errors
+
+    def validate(self, rows):
+        """Converts and checks a batch of raw rows (or an (N, F) array); see Validation."""
+        features, errors = self.to_array(rows)
+        for i, error in self.check(features).items():
+            # Rows that could not be converted keep their first error
+            errors.setdefault(i, error)
+        valid = np.ones(len(features), dtype=bool)
+        if errors:
+            valid[list(errors)] = False
+        return Validation(features, valid, [{'index': i, 'error': errors[i]} for i in sorted(errors)])
+
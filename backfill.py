@@ -0,0 +1,68 @@
+'''
+Sharded offline scoring of a CSV, NPY or Parquet feature file, for backfills.
+
+The input is split into shards scored on a pool of worker processes, each
+loading the model once (see app/backfill.py). Results are NDJSON, one line
+per input row in input order, as from score.py. Progress is saved after
+every shard: rerunning an interrupted job resumes after the last finished
+shard.
+
+Usage:
+    python backfill.py features.npy -o predictions.jsonl --workers 8
+    python backfill.py features.parquet -o predictions.jsonl   # needs pyarrow
+    python backfill.py features.csv -o predictions.jsonl --fresh
+'''
+
+import argparse
+import logging
+import os
+import sys
+
+from app import backfill
+from app.forest import find_model
+from app.serve import cpu_count
+from app.validation import DEFAULT_MARGIN
+
+
+def default_model():
+    # sklearn outscores the compiled forest on large chunks, so the joblib
+    # model is preferred here (the servers prefer the compiled one)
+    for path in ('app/model.joblib', 'model.joblib'):
+        if os.path.exists(path):
+            return path
+    return find_model(['app/model.joblib', 'model.joblib']) or 'app/model.joblib'
+
+
+def report(progress):
+    total = progress['job']['shards']
+    print('shard %d/%d: %d rows (%d errors), %.0f rows/s' % (
+        progress['done'], total, progress['rows'], progress['errors'], progress['rows_per_s']), file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='CSV, .npy (N x 4) or .parquet file')
+    parser.add_argument('-o', '--output', required=True, help='NDJSON output file')
+    parser.add_argument('--format', choices=backfill.FORMATS, help='input format (default: from the file extension)')
+    parser.add_argument('--model', help='model to use (default: app/model.joblib, else app/model.forest)')
+    parser.add_argument('--workers', type=int, default=cpu_count(), help='worker processes (default: usable CPUs)')
+    parser.add_argument('--shard-rows', type=int, default=backfill.DEFAULT_SHARD_ROWS,
+                        help='rows per shard, the unit of progress (Parquet: one row group per shard)')
+    parser.add_argument('--chunk-size', type=int, default=backfill.DEFAULT_CHUNK_ROWS, help='rows per model call')
+    parser.add_argument('--range-margin', type=float, default=DEFAULT_MARGIN,
+                        help='reject rows beyond the training ranges widened by this fraction; negative disables')
+    parser.add_argument('--fresh', action='store_true', help='ignore earlier progress and start over')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    model_path = args.model or default_model()
+    result = backfill.run(args.input, args.output, model_path, fmt=args.format, workers=args.workers,
+                          shard_rows=args.shard_rows, chunk_rows=args.chunk_size, range_margin=args.range_margin,
+                          fresh=args.fresh, report=report)
+    print('Scored %d rows in %.2fs (%d rows, %d errors in total): %.0f rows/s, %.0f rows/s per core, %d workers' % (
+        result['scored_rows'], result['elapsed_s'], result['rows'], result['errors'], result['rows_per_s'],
+        result['rows_per_s_per_core'], result['workers']), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+'''
+Time-to-first-prediction for each model artifact format.
+
+Every measurement runs in a fresh Python process, like a cold serverless
+invocation or a newly started uvicorn worker: import, load, predict once.
+
+Usage:
+    python benchmarks/cold_start.py [--model app/model.joblib] [--repeat 5]
+'''
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CHILD = '''
+import json, time
+t0 = time.perf_counter()
+import numpy as np
+from app.forest import load_model
+t1 = time.perf_counter()
+model = load_model(%r)
+t2 = time.perf_counter()
+model.predict(np.array([[5.1, 3.5, 1.4, 0.2]], dtype=np.float32))
+t3 = time.perf_counter()
+print(json.dumps({'import_s': t1 - t0, 'load_s': t2 - t1, 'first_predict_s': t3 - t2}))
+'''
+
+
+def measure(path, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run(
+            [sys.executable, '-c', CHILD % path],
+            cwd=ROOT, check=True, capture_output=True, text=True,
+        ).stdout
+        wall = time.perf_counter() - start
+        run = json.loads(out.strip().splitlines()[-1])
+        run['process_total_s'] = wall
+        runs.append(run)
+    return {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default=os.path.join('app', 'model.joblib'), help='joblib model to compare against')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    import joblib
+    from app.forest import CompiledForest
+
+    forest = CompiledForest.from_model(joblib.load(os.path.join(ROOT, args.model)))
+    with tempfile.TemporaryDirectory() as tmp:
+        npz = os.path.join(tmp, 'model.forest.npz')
+        directory = os.path.join(tmp, 'model.forest')
+        import numpy as np
+        np.savez(npz, **forest.arrays())
+        forest.save(directory)
+
+        results = {
+            'joblib': measure(os.path.join(ROOT, args.model), args.repeat),
+            'compiled_npz': measure(npz, args.repeat),
+            'compiled_mmap': measure(directory, args.repeat),
+        }
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+'''
+Image size and time to first successful /predict of the container image.
+
+Builds each Dockerfile given (default: the repository's), starts a container
+from it and polls /predict until it answers 200, then /ready. Prints JSON
+per image: size, seconds from `docker run` to the first 200 from /predict,
+and to /ready. Needs docker.
+
+Compare against an older Dockerfile by extracting it first:
+
+    git show <rev>:Dockerfile > /tmp/Dockerfile.old
+    python benchmarks/container.py Dockerfile /tmp/Dockerfile.old
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BODY = json.dumps({'features': [5.1, 3.5, 1.4, 0.2]}).encode()
+
+
+def docker(*args):
+    return subprocess.run(['docker'] + list(args), cwd=ROOT, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def status(url, body=None):
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=2) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except OSError:
+        return None
+
+
+def measure(dockerfile, port, timeout):
+    tag = 'iris-bench-%s' % os.path.basename(dockerfile).lower().replace('.', '-')
+    docker('build', '-q', '-f', dockerfile, '-t', tag, '.')
+    size = int(docker('image', 'inspect', '--format', '{{.Size}}', tag))
+    url = 'http://127.0.0.1:%d' % port
+    start = time.perf_counter()
+    container = docker('run', '-d', '--rm', '-p', '%d:8000' % port, tag)
+    try:
+        first_predict = ready = None
+        while time.perf_counter() - start < timeout and ready is None:
+            if first_predict is None and status(url + '/predict', BODY) == 200:
+                first_predict = time.perf_counter() - start
+            # Images without a readiness endpoint count as ready at their first prediction
+            if first_predict is not None and status(url + '/ready') in (200, 404):
+                ready = time.perf_counter() - start
+            time.sleep(0.05)
+    finally:
+        docker('stop', container)
+    return {'dockerfile': dockerfile, 'image_mib': size / 2 ** 20, 'first_predict_s': first_predict, 'ready_s': ready}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('dockerfiles', nargs='*', default=['Dockerfile'])
+    parser.add_argument('--port', type=int, default=8767)
+    parser.add_argument('--timeout', type=float, default=120.0, help='seconds to wait for the first prediction')
+    args = parser.parse_args()
+    print(json.dumps([measure(path, args.port, args.timeout) for path in args.dockerfiles], indent=2))
+
+
+if __name__ == '__main__':
+    main()
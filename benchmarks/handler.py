@@ -0,0 +1,104 @@
+'''
+Cold versus warm invocation latency of the serverless handler.
+
+Cold: a fresh process imports the handler module and serves one request,
+as on a new Vercel instance. Warm: repeated requests to an already
+initialized handler in this process.
+
+Usage:
+    python benchmarks/handler.py [--handler api/predict.py] [--repeat 5] [--requests 1000]
+'''
+
+import argparse
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BODY = json.dumps({'features': [5.1, 3.5, 1.4, 0.2]}).encode()
+
+
+class FakeRequest:
+    """Minimal stand-in for the runtime's request object."""
+
+    def __init__(self, data=BODY, method='POST'):
+        self.method = method
+        self.data = data
+
+
+def load_handler(path):
+    spec = importlib.util.spec_from_file_location('bench_predict_handler', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.handler
+
+
+CHILD = '''
+import io, json, sys, time, contextlib
+t0 = time.perf_counter()
+sys.path.insert(0, %(root)r)
+from benchmarks.handler import FakeRequest, load_handler
+with contextlib.redirect_stdout(io.StringIO()):
+    handler = load_handler(%(path)r)
+    t1 = time.perf_counter()
+    body, status = handler(FakeRequest())
+t2 = time.perf_counter()
+assert int(status) == 200, body
+print(json.dumps({'import_s': t1 - t0, 'first_request_s': t2 - t1, 'cold_total_s': t2 - t0}))
+'''
+
+
+def cold(path, repeat):
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, '-c', CHILD % {'root': ROOT, 'path': path}],
+            cwd=ROOT, check=True, capture_output=True, text=True,
+        ).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    return {key: statistics.median(r[key] for r in runs) for key in runs[0]}
+
+
+def warm(path, n_requests):
+    import contextlib
+    import io
+
+    # Older handlers print on every call; keep that I/O in the measurement
+    # but out of the terminal.
+    sink = io.StringIO()
+    with contextlib.redirect_stdout(sink):
+        handler = load_handler(path)
+        handler(FakeRequest())
+        latencies = []
+        for _ in range(n_requests):
+            start = time.perf_counter()
+            handler(FakeRequest())
+            latencies.append(time.perf_counter() - start)
+            sink.seek(0)
+            sink.truncate()
+    latencies.sort()
+    return {
+        'p50_ms': latencies[len(latencies) // 2] * 1e3,
+        'p99_ms': latencies[int(len(latencies) * 0.99)] * 1e3,
+        'mean_ms': statistics.fmean(latencies) * 1e3,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--handler', default=os.path.join(ROOT, 'api', 'predict.py'))
+    parser.add_argument('--repeat', type=int, default=5, help='cold starts to measure')
+    parser.add_argument('--requests', type=int, default=1000, help='warm requests to measure')
+    args = parser.parse_args()
+
+    path = os.path.abspath(args.handler)
+    print(json.dumps({'handler': path, 'cold': cold(path, args.repeat), 'warm': warm(path, args.requests)}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+'''
+Load-testing harness for every serving path.
+
+Targets:
+    inprocess   the FastAPI app through its ASGI test client (no network)
+    uvicorn     a local server started with `python -m app.serve`, over HTTP
+    handler     the Vercel function api/predict.py::handler, with a fake request
+    backfill    offline sharded scoring (app/backfill.py) of --backfill-rows
+                synthetic rows from an .npy file, on --workers processes
+
+Each target runs in a fresh process, so its cold start (process start to
+first successful prediction) and peak RSS are its own. The load phase sends
+--requests requests from --concurrency threads; with --batch-size 1 they go
+to /predict, otherwise to /predict/batch (the handler only supports single
+rows). Rows are unique unless --cached is given. Results are printed as
+JSON: throughput, p50/p95/p99 latency, cold start and peak RSS per target;
+for backfill, rows/s overall and per core instead of request latencies.
+
+Pass --baseline with an earlier run's output to fail (exit status 1) when
+throughput (rows/s) drops or p99 latency grows by more than --tolerance.
+
+Usage:
+    python benchmarks/harness.py --targets inprocess handler uvicorn \\
+        --concurrency 8 --batch-size 1 --requests 2000 > bench.json
+    python benchmarks/harness.py --baseline bench.json
+'''
+
+import argparse
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+_PROCESS_START = time.perf_counter()
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+ROWS = [
+    [5.1, 3.5, 1.4, 0.2],
+    [6.7, 3.0, 5.2, 2.3],
+    [5.9, 3.0, 4.2, 1.5],
+    [4.6, 3.1, 1.5, 0.2],
+]
+
+# Training feature ranges; uncached rows are drawn uniformly from them
+LOW = (4.3, 2.0, 1.0, 0.1)
+HIGH = (7.9, 4.4, 6.9, 2.5)
+
+TARGETS = ('inprocess', 'uvicorn', 'handler', 'backfill')
+
+
+def row(n, cached):
+    """
+    Feature row number n. With ``cached`` it is one of the four ROWS, so
+    almost every request hits the prediction cache. Otherwise it is a fresh
+    random row inside the training ranges (seeded by n, so every process
+    sends the same ones): rows do not repeat, and latencies measure the
+    model path.
+    """
+    if cached:
+        return ROWS[n % len(ROWS)]
+    rng = random.Random(n)
+    return [round(rng.uniform(low, high), 6) for low, high in zip(LOW, HIGH)]
+
+
+def payload(batch_size, i, cached=False):
+    """Request body for request number i."""
+    if batch_size == 1:
+        return {'features': row(i, cached)}
+    return {'instances': [row(i * batch_size + j, cached) for j in range(batch_size)]}
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(q / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_load(call, n_requests, concurrency, batch_size):
+    """
+    Calls ``call(i)`` n_requests times from ``concurrency`` threads.
+
+    ``call`` returns True on success. Returns throughput and latency stats.
+    """
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(n_requests))
+
+    def worker():
+        local = []
+        failed = 0
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            start = time.perf_counter()
+            try:
+                ok = call(i)
+            except Exception:
+                ok = False
+            local.append(time.perf_counter() - start)
+            failed += not ok
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    ms = [v * 1e3 for v in latencies]
+    return {
+        'requests': n_requests,
+        'errors': errors[0],
+        'wall_s': wall,
+        'throughput_rps': n_requests / wall,
+        'throughput_rows_per_s': n_requests * batch_size / wall,
+        'latency_ms': {
+            'mean': statistics.fmean(ms),
+            'p50': percentile(ms, 50),
+            'p95': percentile(ms, 95),
+            'p99': percentile(ms, 99),
+            'max': ms[-1],
+        },
+    }
+
+
+def self_peak_rss():
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def tree_peak_rss(pid):
+    """Sums VmHWM (peak RSS) over a process and its children, from /proc."""
+    total = 0
+    pids = [pid]
+    try:
+        with open('/proc/%d/task/%d/children' % (pid, pid)) as f:
+            pids += [int(child) for child in f.read().split()]
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            with open('/proc/%d/status' % p) as f:
+                for line in f:
+                    if line.startswith('VmHWM:'):
+                        total += int(line.split()[1]) * 1024
+        except OSError:
+            pass
+    return total or None
+
+
+def child_inprocess(args):
+    from fastapi.testclient import TestClient
+    from app.server import app
+
+    path = '/predict' if args.batch_size == 1 else '/predict/batch'
+    # As a context manager the client runs one event loop for all requests,
+    # like a real server process.
+    with TestClient(app) as client:
+        def call(i):
+            return client.post(path, json=payload(args.batch_size, i, args.cached)).status_code == 200
+
+        assert call(0)
+        cold_start = time.perf_counter() - _PROCESS_START
+        result = run_load(call, args.requests, args.concurrency, args.batch_size)
+    result.update(cold_start_s=cold_start, peak_rss_bytes=self_peak_rss())
+    return result
+
+
+def child_handler(args):
+    from benchmarks.handler import FakeRequest, load_handler
+
+    if args.batch_size != 1:
+        return {'skipped': 'the serverless handler only scores single rows'}
+    handler = load_handler(os.path.join(ROOT, 'api', 'predict.py'))
+    bodies = [json.dumps(payload(1, i, args.cached)).encode() for i in range(args.requests)]
+
+    def call(i):
+        _, status = handler(FakeRequest(bodies[i]))
+        return int(status) == 200
+
+    assert call(0)
+    cold_start = time.perf_counter() - _PROCESS_START
+    result = run_load(call, args.requests, args.concurrency, args.batch_size)
+    result.update(cold_start_s=cold_start, peak_rss_bytes=self_peak_rss())
+    return result
+
+
+def child_uvicorn(args):
+    import requests
+
+    url = 'http://127.0.0.1:%d' % args.port
+    path = '/predict' if args.batch_size == 1 else '/predict/batch'
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'app.serve', '--port', str(args.port),
+         '--workers', str(args.workers), '--log-level', 'warning'],
+        cwd=ROOT,
+    )
+    try:
+        deadline = start + 120
+        while True:
+            try:
+                if requests.post(url + path, json=payload(args.batch_size, 0, args.cached), timeout=1).ok:
+                    break
+            except requests.ConnectionError:
+                pass
+            if time.perf_counter() > deadline or server.poll() is not None:
+                raise RuntimeError('server did not become ready')
+            time.sleep(0.05)
+        cold_start = time.perf_counter() - start
+
+        local = threading.local()
+
+        def call(i):
+            # One keep-alive session per load thread
+            session = getattr(local, 'session', None)
+            if session is None:
+                session = local.session = requests.Session()
+            return session.post(url + path, json=payload(args.batch_size, i, args.cached)).status_code == 200
+
+        result = run_load(call, args.requests, args.concurrency, args.batch_size)
+        result.update(cold_start_s=cold_start, peak_rss_bytes=tree_peak_rss(server.pid),
+                      workers=args.workers)
+        return result
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def child_backfill(args):
+    import tempfile
+    import numpy as np
+    from app import backfill
+    from app.serve import cpu_count
+
+    rng = np.random.default_rng(0)
+    # Uniform over the iris training ranges, so every row passes validation
+    X = rng.uniform(LOW, HIGH, (args.backfill_rows, 4)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        np.save(os.path.join(tmp, 'features.npy'), X)
+        del X
+        result = backfill.run(os.path.join(tmp, 'features.npy'), os.path.join(tmp, 'predictions.jsonl'),
+                              os.path.join(ROOT, 'app', 'model.joblib'), workers=args.workers,
+                              shard_rows=max(1, args.backfill_rows // (4 * args.workers)))
+    return {
+        'rows': result['rows'],
+        'errors': result['errors'],
+        'wall_s': result['elapsed_s'],
+        'throughput_rows_per_s': result['rows_per_s'],
+        'rows_per_s_per_core': result['rows_per_s_per_core'],
+        'workers': result['workers'],
+        'cpus': cpu_count(),
+        'peak_rss_bytes': self_peak_rss(),
+    }
+
+
+CHILDREN = {'inprocess': child_inprocess, 'handler': child_handler, 'uvicorn': child_uvicorn,
+            'backfill': child_backfill}
+
+
+def run_target(target, args):
+    command = [sys.executable, os.path.abspath(__file__), '--child', target,
+               '--requests', str(args.requests), '--concurrency', str(args.concurrency),
+               '--batch-size', str(args.batch_size), '--port', str(args.port),
+               '--workers', str(args.workers), '--backfill-rows', str(args.backfill_rows)] + (
+                   ['--cached'] if args.cached else [])
+    out = subprocess.run(command, cwd=ROOT, check=True, capture_output=True, text=True).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    if result.get('peak_rss_bytes'):
+        result['peak_rss_mib'] = result.pop('peak_rss_bytes') / 2 ** 20
+    return dict(target=target, concurrency=args.concurrency, batch_size=args.batch_size,
+                cached=args.cached, **result)
+
+
+def regressions(results, baseline, tolerance):
+    """Lists targets whose throughput or p99 latency regressed beyond the tolerance."""
+    found = []
+    def key(r):
+        return r['target'], r['concurrency'], r['batch_size'], r.get('cached', False)
+
+    previous = {key(r): r for r in baseline if 'skipped' not in r}
+    for r in results:
+        old = previous.get(key(r))
+        if old is None or 'skipped' in r:
+            continue
+        if r['throughput_rows_per_s'] < old['throughput_rows_per_s'] * (1 - tolerance):
+            found.append('%s: throughput %.0f -> %.0f rows/s' % (
+                r['target'], old['throughput_rows_per_s'], r['throughput_rows_per_s']))
+        if 'latency_ms' in r and r['latency_ms']['p99'] > old['latency_ms']['p99'] * (1 + tolerance):
+            found.append('%s: p99 %.2f -> %.2f ms' % (r['target'], old['latency_ms']['p99'], r['latency_ms']['p99']))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS))
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--batch-size', type=int, default=1)
+    parser.add_argument('--port', type=int, default=8766, help='port for the uvicorn target')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes for the uvicorn and backfill targets')
+    parser.add_argument('--backfill-rows', type=int, default=500000, help='rows scored by the backfill target')
+    parser.add_argument('--cached', action='store_true',
+                        help='repeat the same few rows, so most requests hit the prediction cache')
+    parser.add_argument('--baseline', help='earlier JSON output to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression')
+    parser.add_argument('--child', choices=TARGETS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(CHILDREN[args.child](args)))
+        return
+
+    results = [run_target(target, args) for target in args.targets]
+    print(json.dumps(results, indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print('REGRESSION ' + line, file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+'''
+Total memory of the pre-fork launcher as the worker count grows.
+
+Starts `python -m app.serve` with each worker count, sends some traffic,
+then sums RSS and PSS over the workers. RSS counts shared pages once per
+process; PSS splits them, so PSS growth per worker is the real cost of one
+more worker.
+
+Usage:
+    python benchmarks/workers_memory.py [--workers 1 2 4 8] [--model app/model.forest]
+'''
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from app.serve import memory_usage  # noqa: E402
+
+
+def children(pid):
+    with open('/proc/%d/task/%d/children' % (pid, pid)) as f:
+        return [int(child) for child in f.read().split()]
+
+
+def wait_ready(url, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError('server did not start: %s' % url)
+
+
+def measure(n_workers, port, model, requests):
+    env = dict(os.environ)
+    if model:
+        env['MODEL_PATH'] = model
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'app.serve', '--workers', str(n_workers), '--port', str(port),
+         '--log-level', 'warning'],
+        cwd=ROOT, env=env,
+    )
+    try:
+        base = 'http://127.0.0.1:%d' % port
+        wait_ready(base + '/')
+        body = json.dumps({'instances': [[5.1, 3.5, 1.4, 0.2]] * 64}).encode()
+        for _ in range(requests):
+            request = urllib.request.Request(base + '/predict/batch', data=body,
+                                             headers={'Content-Type': 'application/json'})
+            urllib.request.urlopen(request).read()
+        workers = [memory_usage(pid) for pid in children(proc.pid)]
+        parent = memory_usage(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+    mib = 2 ** 20
+    return {
+        'workers': n_workers,
+        'parent_rss_mib': parent['rss_bytes'] / mib,
+        'per_worker_rss_mib': [w['rss_bytes'] / mib for w in workers],
+        'total_worker_rss_mib': sum(w['rss_bytes'] for w in workers) / mib,
+        'total_worker_pss_mib': sum(w['pss_bytes'] for w in workers) / mib,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--model', help='MODEL_PATH for the server (default: its own default)')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+
+    results = [measure(n, args.port, args.model, args.requests) for n in args.workers]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
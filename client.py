@@ -2,8 +2,7 @@
 Script for inferencing the deployed model
 '''
 
-import json
-import requests
+from iris_client import PredictClient
 
 data = [[4.3, 3. , 1.1, 0.1],
        [5.8, 4. , 1.2, 0.2],
@@ -18,15 +17,10 @@ data = [[4.3, 3. , 1.1, 0.1],
        [5.1, 3.3, 1.7, 0.5],
        [4.8, 3.4, 1.9, 0.2]]
 
-url = 'http://0.0.0.0:8000/predict/'
+url = 'http://0.0.0.0:8000'
 
-predictions = []
-for record in data:
-    payload = {'features': record}
-    payload = json.dumps(payload)
-    response = requests.post(url, data=payload)
-    predictions.append(response.json()['predicted_class'])
+# All rows go out in one /predict/batch call over a pooled connection
+with PredictClient(url) as client:
+    predictions = client.predict(data)
 
 print(predictions)
-
-
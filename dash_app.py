@@ -1,14 +1,100 @@
 """
 Dash Web Application for ML Model Inference
 Interactive web interface to input iris features and get predictions
+
+The API is reached at IRIS_API_URL (default http://0.0.0.0:8000) through one
+pooled client shared by every session. Predictions are cached in-process,
+so analysts exploring the same values do not repeat API calls.
 """
 
+from collections import OrderedDict
+import os
+import threading
+
 import dash
-from dash import dcc, html, Input, Output, State, callback
+from dash import dcc, html, Input, Output, Patch, ctx
 import requests
-import json
 import plotly.graph_objs as go
 
+from iris_client import DEFAULT_URL, APIError, PredictClient
+
+API_URL = os.environ.get('IRIS_API_URL', DEFAULT_URL)
+
+# One pooled client shared by all callbacks (and all browser sessions)
+client = PredictClient(API_URL, concurrency=8)
+
+# Seconds of typing pause before a live prediction is sent
+LIVE_DEBOUNCE_S = 0.4
+
+# Feature rows (rounded like the inputs) -> predicted class, least recently used evicted first
+CACHE_SIZE = 4096
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+
+FEATURE_LABELS = ['Sepal Length', 'Sepal Width', 'Petal Length', 'Petal Width']
+
+DEFAULT_FEATURES = [5.1, 3.5, 1.4, 0.2]
+
+
+def _key(row):
+    return tuple(round(float(value), 4) for value in row)
+
+
+def _remember(key, prediction):
+    with _cache_lock:
+        _cache[key] = prediction
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+
+def cached_predict_one(features):
+    """Predicts one row, from the cache when it has been scored before."""
+    key = _key(features)
+    with _cache_lock:
+        prediction = _cache.get(key)
+    if prediction is None:
+        # Invalid rows raise APIError (a 422 with the reason) and are not cached
+        prediction = client.predict_one(list(key))
+        _remember(key, prediction)
+    return prediction
+
+
+def cached_predict(rows):
+    """
+    Predicts many rows with one batch call for the rows not cached yet.
+
+    Invalid rows raise APIError (a 422 listing them in ``errors``); nothing
+    from that call is cached.
+    """
+    keys = [_key(row) for row in rows]
+    known = {}
+    with _cache_lock:
+        for key in keys:
+            if key in _cache:
+                known[key] = _cache[key]
+    missing = [key for key in dict.fromkeys(keys) if key not in known]
+    if missing:
+        for key, prediction in zip(missing, client.predict([list(key) for key in missing])):
+            known[key] = prediction
+            _remember(key, prediction)
+    return [known[key] for key in keys]
+
+
+def feature_figure(features):
+    """The feature bar chart; callbacks only patch its bar heights afterwards."""
+    fig = go.Figure(data=[
+        go.Bar(x=FEATURE_LABELS, y=features,
+               marker_color=['#3498db', '#e74c3c', '#f39c12', '#27ae60'])
+    ])
+    fig.update_layout(
+        title="Input Features",
+        yaxis_title="Value (cm)",
+        height=300,
+        margin=dict(l=20, r=20, t=40, b=20)
+    )
+    return fig
+
 # Initialize Dash app
 app = dash.Dash(__name__)
 
@@ -31,6 +117,7 @@ app.layout = html.Div([
                     step=0.1,
                     min=0,
                     max=10,
+                    debounce=LIVE_DEBOUNCE_S,
                     style={'width': '100%', 'padding': '8px', 'margin': '5px 0'}
                 )
             ], style={'margin': '10px 0'}),
@@ -45,6 +132,7 @@ app.layout = html.Div([
                     step=0.1,
                     min=0,
                     max=10,
+                    debounce=LIVE_DEBOUNCE_S,
                     style={'width': '100%', 'padding': '8px', 'margin': '5px 0'}
                 )
             ], style={'margin': '10px 0'}),
@@ -59,6 +147,7 @@ app.layout = html.Div([
                     step=0.1,
                     min=0,
                     max=10,
+                    debounce=LIVE_DEBOUNCE_S,
                     style={'width': '100%', 'padding': '8px', 'margin': '5px 0'}
                 )
             ], style={'margin': '10px 0'}),
@@ -73,10 +162,18 @@ app.layout = html.Div([
                     step=0.1,
                     min=0,
                     max=10,
+                    debounce=LIVE_DEBOUNCE_S,
                     style={'width': '100%', 'padding': '8px', 'margin': '5px 0'}
                 )
             ], style={'margin': '10px 0'}),
             
+            dcc.Checklist(
+                id='live-mode',
+                options=[{'label': ' Predict as you type', 'value': 'live'}],
+                value=[],
+                style={'marginTop': '10px'}
+            ),
+
             html.Button(
                 'Predict Class',
                 id='predict-button',
@@ -131,7 +228,7 @@ app.layout = html.Div([
             
             html.Div([
                 html.H4("Feature Visualization", style={'color': '#34495e', 'marginTop': '30px'}),
-                dcc.Graph(id='feature-plot')
+                dcc.Graph(id='feature-plot', figure=feature_figure(DEFAULT_FEATURES))
             ])
             
         ], style={
@@ -171,20 +268,21 @@ app.layout = html.Div([
     })
 ])
 
-# Callback for making predictions
+# Callback for making predictions: on a click, or on every (debounced) edit in live mode
 @app.callback(
     [Output('prediction-output', 'children'),
      Output('prediction-output', 'style'),
      Output('error-output', 'children'),
      Output('error-output', 'style'),
      Output('feature-plot', 'figure')],
-    [Input('predict-button', 'n_clicks')],
-    [State('sepal-length', 'value'),
-     State('sepal-width', 'value'),
-     State('petal-length', 'value'),
-     State('petal-width', 'value')]
+    [Input('predict-button', 'n_clicks'),
+     Input('sepal-length', 'value'),
+     Input('sepal-width', 'value'),
+     Input('petal-length', 'value'),
+     Input('petal-width', 'value'),
+     Input('live-mode', 'value')]
 )
-def predict_class(n_clicks, sepal_length, sepal_width, petal_length, petal_width):
+def predict_class(n_clicks, sepal_length, sepal_width, petal_length, petal_width, live_mode):
     default_style = {
         'fontSize': '24px',
         'fontWeight': 'bold',
@@ -202,23 +300,18 @@ def predict_class(n_clicks, sepal_length, sepal_width, petal_length, petal_width
     error_hidden = {'color': '#e74c3c', 'marginTop': '10px', 'padding': '10px', 
                    'backgroundColor': '#fadbd8', 'borderRadius': '5px', 'display': 'none'}
     
-    # Create feature visualization
+    # Only the bar heights change, so the browser gets a small patch
+    # instead of a whole new figure
     features = [sepal_length or 0, sepal_width or 0, petal_length or 0, petal_width or 0]
-    feature_names = ['Sepal Length', 'Sepal Width', 'Petal Length', 'Petal Width']
-    
-    fig = go.Figure(data=[
-        go.Bar(x=feature_names, y=features, 
-               marker_color=['#3498db', '#e74c3c', '#f39c12', '#27ae60'])
-    ])
-    fig.update_layout(
-        title="Input Features",
-        yaxis_title="Value (cm)",
-        height=300,
-        margin=dict(l=20, r=20, t=40, b=20)
-    )
+    fig = Patch()
+    fig['data'][0]['y'] = features
     
-    if n_clicks == 0:
-        return "Click 'Predict Class' to get prediction", default_style, "", error_hidden, fig
+    clicked = ctx.triggered_id == 'predict-button'
+    if not clicked and not live_mode:
+        if n_clicks == 0 and ctx.triggered_id is None:
+            return "Click 'Predict Class' to get prediction", default_style, "", error_hidden, fig
+        # An edit without live mode: just follow it in the chart
+        return dash.no_update, dash.no_update, dash.no_update, dash.no_update, fig
     
     # Validate inputs
     if any(val is None for val in [sepal_length, sepal_width, petal_length, petal_width]):
@@ -228,38 +321,29 @@ def predict_class(n_clicks, sepal_length, sepal_width, petal_length, petal_width
         return "Invalid Input", default_style, error_msg, error_visible, fig
     
     try:
-        # Prepare data for API call
-        url = 'http://0.0.0.0:8000/predict/'
-        payload = {'features': [sepal_length, sepal_width, petal_length, petal_width]}
+        # Make API request (or reuse a cached answer)
+        predicted_class = cached_predict_one([sepal_length, sepal_width, petal_length, petal_width])
         
-        # Make API request
-        response = requests.post(url, data=json.dumps(payload), 
-                               headers={'Content-Type': 'application/json'})
+        # Color coding for different classes
+        class_colors = {
+            'setosa': '#27ae60',
+            'versicolor': '#f39c12', 
+            'virginica': '#e74c3c'
+        }
         
-        if response.status_code == 200:
-            result = response.json()
-            predicted_class = result['predicted_class']
-            
-            # Color coding for different classes
-            class_colors = {
-                'setosa': '#27ae60',
-                'versicolor': '#f39c12', 
-                'virginica': '#e74c3c'
-            }
-            
-            success_style = default_style.copy()
-            success_style['color'] = class_colors.get(predicted_class, '#2c3e50')
-            success_style['border'] = f'3px solid {class_colors.get(predicted_class, "#2c3e50")}'
-            
-            return f"🌸 {predicted_class.title()}", success_style, "", error_hidden, fig
-        else:
-            error_msg = f"API Error: {response.status_code} - {response.text}"
-            error_visible = {'color': '#e74c3c', 'marginTop': '10px', 'padding': '10px', 
-                           'backgroundColor': '#fadbd8', 'borderRadius': '5px', 'display': 'block'}
-            return "Prediction Failed", default_style, error_msg, error_visible, fig
+        success_style = default_style.copy()
+        success_style['color'] = class_colors.get(predicted_class, '#2c3e50')
+        success_style['border'] = f'3px solid {class_colors.get(predicted_class, "#2c3e50")}'
+        
+        return f"🌸 {predicted_class.title()}", success_style, "", error_hidden, fig
             
+    except APIError as e:
+        error_msg = f"API Error: {e.status_code} - {e.detail}"
+        error_visible = {'color': '#e74c3c', 'marginTop': '10px', 'padding': '10px', 
+                       'backgroundColor': '#fadbd8', 'borderRadius': '5px', 'display': 'block'}
+        return "Prediction Failed", default_style, error_msg, error_visible, fig
     except requests.exceptions.ConnectionError:
-        error_msg = "Cannot connect to ML API. Make sure the Docker container is running on port 8000."
+        error_msg = f"Cannot connect to ML API at {API_URL}. Make sure the Docker container is running on port 8000."
         error_visible = {'color': '#e74c3c', 'marginTop': '10px', 'padding': '10px', 
                         'backgroundColor': '#fadbd8', 'borderRadius': '5px', 'display': 'block'}
         return "Connection Error", default_style, error_msg, error_visible, fig
@@ -287,25 +371,21 @@ def load_sample_data(n_clicks):
     ]
     
     try:
-        url = 'http://0.0.0.0:8000/predict/'
+        # All samples in one batch request (cached samples are not resent)
+        predictions = cached_predict(sample_data)
         results = []
         
-        for features in sample_data:
-            payload = {'features': features}
-            response = requests.post(url, data=json.dumps(payload),
-                                   headers={'Content-Type': 'application/json'})
-            if response.status_code == 200:
-                prediction = response.json()['predicted_class']
-                results.append(html.Div([
-                    html.Span(f"Features: {features} → ", style={'fontFamily': 'monospace'}),
-                    html.Span(f"{prediction.title()}", 
-                             style={'fontWeight': 'bold', 'color': '#2c3e50'})
-                ], style={'margin': '5px 0', 'padding': '5px', 'backgroundColor': '#ffffff', 'borderRadius': '3px'}))
-            else:
-                results.append(html.Div(f"Error for {features}: {response.status_code}"))
+        for features, prediction in zip(sample_data, predictions):
+            results.append(html.Div([
+                html.Span(f"Features: {features} → ", style={'fontFamily': 'monospace'}),
+                html.Span(f"{prediction.title()}", 
+                         style={'fontWeight': 'bold', 'color': '#2c3e50'})
+            ], style={'margin': '5px 0', 'padding': '5px', 'backgroundColor': '#ffffff', 'borderRadius': '3px'}))
         
         return results
         
+    except APIError as e:
+        return html.Div(f"Error loading samples: {e.status_code}", style={'color': '#e74c3c'})
     except Exception as e:
         return html.Div(f"Error loading samples: {str(e)}", style={'color': '#e74c3c'})
 
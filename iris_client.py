@@ -0,0 +1,351 @@
+'''
+Client library for the iris prediction API.
+
+PredictClient (sync, over a keep-alive requests session) and
+AsyncPredictClient (asyncio, over httpx) share the same behaviour:
+
+- Connections are pooled and reused across calls.
+- ``predict(rows)`` splits the rows into /predict/batch calls of at most
+  ``batch_size`` rows and sends up to ``concurrency`` of them at once.
+- A server without /predict/batch (404/405) is remembered, and rows are then
+  sent one per /predict call instead, still ``concurrency`` at a time. If
+  /predict/batch goes away partway through a run, only the rows of the
+  batches it did not answer are resent.
+- Connection errors, timeouts and 429/502/503/504 responses are retried up
+  to ``retries`` times with exponential backoff and jitter, honouring
+  Retry-After. Other errors raise APIError.
+- Rows the server rejects (non-finite or out-of-range features) make
+  ``predict`` raise APIError with status 422 once all rows are scored, on
+  the batch and the one-row-per-call paths alike. Its ``errors`` lists
+  {"index": i, "error": ...} with i indexing the rows passed in.
+
+Usage:
+    with PredictClient('http://localhost:8000') as client:
+        client.predict([[5.1, 3.5, 1.4, 0.2], [6.7, 3.0, 5.2, 2.3]])
+
+    async with AsyncPredictClient('http://localhost:8000') as client:
+        await client.predict(rows)
+
+httpx is only needed for AsyncPredictClient.
+'''
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+DEFAULT_URL = 'http://0.0.0.0:8000'
+
+# Rows per /predict/batch call; the server accepts up to MAX_BATCH_SIZE (10000 by default)
+DEFAULT_BATCH_SIZE = 1000
+
+# Responses worth retrying: overload and gateway errors
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+
+# Responses meaning the server has no batch endpoint
+NO_BATCH_STATUSES = frozenset({404, 405})
+
+
+class APIError(Exception):
+    """
+    The API answered with an error status.
+
+    ``errors`` is set when ``predict`` had rows rejected: one
+    {"index": i, "error": ...} per rejected row, in row order.
+    """
+
+    def __init__(self, status_code, detail, errors=None):
+        super().__init__('API error %d: %s' % (status_code, detail))
+        self.status_code = status_code
+        self.detail = detail
+        self.errors = errors
+
+
+def chunks(rows, size):
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+def retry_delay(attempt, backoff, retry_after=None):
+    """
+    Seconds to wait before retry number ``attempt`` (0-based): the server's
+    Retry-After if it sent one, else exponential backoff with full jitter.
+    """
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, backoff * 2 ** attempt)
+
+
+class _Base:
+    def __init__(self, url, batch_size, concurrency, retries, backoff, timeout):
+        self.url = url.rstrip('/')
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        # None until the first batch call tells us whether the server has /predict/batch
+        self.batch_supported = None
+
+    @staticmethod
+    def _result(status_code, body, key):
+        if status_code != 200:
+            detail = body.get('detail', body) if isinstance(body, dict) else body
+            raise APIError(status_code, detail)
+        return body[key]
+
+    @classmethod
+    def _batch_result(cls, status_code, body, offset):
+        """(names, errors) of a /predict/batch response for the rows from ``offset`` on."""
+        names = cls._result(status_code, body, 'predicted_classes')
+        errors = [{'index': offset + error['index'], 'error': error['error']} for error in body.get('errors', ())]
+        return names, errors
+
+    @staticmethod
+    def _row_error(error, index):
+        """The (name, errors) of a /predict call that failed; re-raises all but rejected rows."""
+        if error.status_code != 422:
+            raise error
+        # /predict names the field; /predict/batch errors do not
+        detail = str(error.detail)
+        if detail.startswith('"features": '):
+            detail = detail[len('"features": '):]
+        return None, [{'index': index, 'error': detail}]
+
+    @staticmethod
+    def _unanswered(batches, results):
+        """The (index, row) pairs of the batches /predict/batch did not answer (result None)."""
+        return [(offset + i, row) for (offset, rows), result in zip(batches, results) if result is None
+                for i, row in enumerate(rows)]
+
+    @staticmethod
+    def _merge(batches, results, row_results):
+        """Batch results in order, each unanswered batch replaced by the results of its rows."""
+        row_results = iter(row_results)
+        merged = []
+        for (offset, rows), result in zip(batches, results):
+            if result is None:
+                merged.extend(next(row_results) for _ in rows)
+            else:
+                merged.append(result)
+        return merged
+
+    @staticmethod
+    def _collect(results, n_rows):
+        """Joins (names, errors) parts in order; raises APIError if any row was rejected."""
+        names, errors = [], []
+        for part_names, part_errors in results:
+            names.extend(part_names if isinstance(part_names, list) else [part_names])
+            errors.extend(part_errors)
+        if errors:
+            raise APIError(422, '%d of %d rows rejected' % (len(errors), n_rows), errors=errors)
+        return names
+
+
+class PredictClient(_Base):
+    """
+    Synchronous client over a pooled keep-alive session.
+
+    Args:
+        url (str): Base URL of the API.
+        batch_size (int): Maximum rows per /predict/batch call.
+        concurrency (int): Maximum requests in flight, and pooled connections.
+        retries (int): Retries per request for retryable failures.
+        backoff (float): Base backoff in seconds; doubles with every retry.
+        timeout (float): Per-request timeout in seconds.
+    """
+
+    def __init__(self, url=DEFAULT_URL, batch_size=DEFAULT_BATCH_SIZE, concurrency=4,
+                 retries=3, backoff=0.1, timeout=10.0):
+        super().__init__(url, batch_size, concurrency, retries, backoff, timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = None
+
+    def _post(self, path, payload):
+        """POSTs JSON with retries; returns (status_code, decoded body)."""
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                response = self.session.post(self.url + path, json=payload, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if last:
+                    raise
+                time.sleep(retry_delay(attempt, self.backoff))
+                continue
+            if response.status_code in RETRY_STATUSES and not last:
+                time.sleep(retry_delay(attempt, self.backoff, response.headers.get('Retry-After')))
+                continue
+            try:
+                return response.status_code, response.json()
+            except ValueError:
+                return response.status_code, response.text
+
+    def _map(self, fn, items):
+        if len(items) == 1 or self.concurrency == 1:
+            return [fn(item) for item in items]
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.concurrency)
+        return list(self._executor.map(fn, items))
+
+    def predict_one(self, features):
+        """Returns the predicted class name for one feature row."""
+        status_code, body = self._post('/predict', {'features': list(features)})
+        return self._result(status_code, body, 'predicted_class')
+
+    def _predict_batch(self, batch):
+        offset, rows = batch
+        status_code, body = self._post('/predict/batch', {'instances': rows})
+        if status_code in NO_BATCH_STATUSES:
+            self.batch_supported = False
+            return None
+        self.batch_supported = True
+        return self._batch_result(status_code, body, offset)
+
+    def _predict_row(self, item):
+        index, row = item
+        try:
+            return self.predict_one(row), []
+        except APIError as e:
+            return self._row_error(e, index)
+
+    def predict(self, rows):
+        """
+        Returns the predicted class names for any number of feature rows, in order.
+
+        Raises:
+            APIError: The server rejected some rows (status 422; see
+                ``APIError.errors``), or failed in another way.
+        """
+        rows = [list(row) for row in rows]
+        if not rows:
+            return []
+        batches = list(zip(range(0, len(rows), self.batch_size), chunks(rows, self.batch_size)))
+        results = [None] * len(batches)
+        if self.batch_supported is None:
+            # Probe with the first batch before sending the rest
+            results[0] = self._predict_batch(batches[0])
+            if results[0] is not None:
+                results[1:] = self._map(self._predict_batch, batches[1:])
+        elif self.batch_supported:
+            results = self._map(self._predict_batch, batches)
+        # Rows /predict/batch did not answer (all of them without it, or those of
+        # the batches sent after it went away) are sent one per /predict call
+        pending = self._unanswered(batches, results)
+        if pending:
+            results = self._merge(batches, results, self._map(self._predict_row, pending))
+        return self._collect(results, len(rows))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AsyncPredictClient(_Base):
+    """
+    asyncio client over a pooled httpx.AsyncClient; same arguments as PredictClient.
+
+    At most ``concurrency`` requests are in flight at once, across all
+    concurrent ``predict`` calls on the client.
+    """
+
+    def __init__(self, url=DEFAULT_URL, batch_size=DEFAULT_BATCH_SIZE, concurrency=16,
+                 retries=3, backoff=0.1, timeout=10.0):
+        if httpx is None:
+            raise ImportError('AsyncPredictClient requires httpx (pip install httpx)')
+        super().__init__(url, batch_size, concurrency, retries, backoff, timeout)
+        limits = httpx.Limits(max_connections=self.concurrency, max_keepalive_connections=self.concurrency)
+        self.client = httpx.AsyncClient(base_url=self.url, limits=limits, timeout=timeout)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+
+    async def _post(self, path, payload):
+        async with self._semaphore:
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    response = await self.client.post(path, json=payload)
+                except (httpx.TransportError, httpx.TimeoutException):
+                    if last:
+                        raise
+                    await asyncio.sleep(retry_delay(attempt, self.backoff))
+                    continue
+                if response.status_code in RETRY_STATUSES and not last:
+                    await asyncio.sleep(retry_delay(attempt, self.backoff, response.headers.get('Retry-After')))
+                    continue
+                try:
+                    return response.status_code, response.json()
+                except ValueError:
+                    return response.status_code, response.text
+
+    async def predict_one(self, features):
+        status_code, body = await self._post('/predict', {'features': list(features)})
+        return self._result(status_code, body, 'predicted_class')
+
+    async def _predict_batch(self, batch):
+        offset, rows = batch
+        status_code, body = await self._post('/predict/batch', {'instances': rows})
+        if status_code in NO_BATCH_STATUSES:
+            self.batch_supported = False
+            return None
+        self.batch_supported = True
+        return self._batch_result(status_code, body, offset)
+
+    async def _predict_row(self, index, row):
+        try:
+            return await self.predict_one(row), []
+        except APIError as e:
+            return self._row_error(e, index)
+
+    async def predict(self, rows):
+        """
+        Returns the predicted class names for any number of feature rows, in order.
+
+        Raises:
+            APIError: As for PredictClient.predict.
+        """
+        rows = [list(row) for row in rows]
+        if not rows:
+            return []
+        batches = list(zip(range(0, len(rows), self.batch_size), chunks(rows, self.batch_size)))
+        results = [None] * len(batches)
+        if self.batch_supported is None:
+            results[0] = await self._predict_batch(batches[0])
+            if results[0] is not None:
+                results[1:] = await asyncio.gather(*(self._predict_batch(batch) for batch in batches[1:]))
+        elif self.batch_supported:
+            results = list(await asyncio.gather(*(self._predict_batch(batch) for batch in batches)))
+        # Only the rows of unanswered batches fall back to /predict
+        pending = self._unanswered(batches, results)
+        if pending:
+            row_results = await asyncio.gather(*(self._predict_row(i, row) for i, row in pending))
+            results = self._merge(batches, results, row_results)
+        return self._collect(results, len(rows))
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
@@ -1,7 +1,13 @@
+import os
+
 import joblib
 from sklearn.datasets import load_iris
 from sklearn.ensemble import RandomForestClassifier
 
+from app.forest import CompiledForest
+from app.registry import publish, replace_artifact
+from app.validation import training_ranges
+
 # Load the Iris dataset
 iris = load_iris()
 X, y = iris.data, iris.target       
@@ -10,5 +16,21 @@ X, y = iris.data, iris.target
 model = RandomForestClassifier(n_estimators=200, random_state=42)
 model.fit(X, y)
 
-# Save the trained model to a file
-joblib.dump(model, 'model.joblib')
\ No newline at end of file
+# Save the trained model to a file (uncompressed, so joblib can memory-map it).
+# Written to a temporary name and renamed over the old file, never rewritten
+# in place: a running server may have the old one memory-mapped.
+tmp = 'model.joblib.%d.tmp' % os.getpid()
+joblib.dump(model, tmp, compress=0)
+os.replace(tmp, 'model.joblib')
+
+# Save the flat-array version used for fast inference (see app/forest.py),
+# with the training feature ranges; requests far outside them are rejected
+# (see app/validation.py). Also staged and renamed into place.
+schema = training_ranges(X)
+replace_artifact(CompiledForest.from_model(model), 'model.forest', schema=schema)
+
+# With MODEL_DIR set, also publish it as a new version there, for running
+# servers with the same MODEL_DIR to hot-reload (see app/registry.py)
+if os.environ.get('MODEL_DIR'):
+    version = publish(CompiledForest.from_model(model), os.environ['MODEL_DIR'], schema=schema)
+    print('Published model version %s to %s' % (version, os.environ['MODEL_DIR']))
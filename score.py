@@ -0,0 +1,62 @@
+'''
+Offline bulk scoring of a JSONL or CSV feature file, without HTTP.
+
+Uses the same chunked pipeline as the /predict/stream endpoint: rows are read
+lazily, scored one chunk per model call and written out as NDJSON results,
+so memory stays constant for inputs of any size.
+
+Usage:
+    python score.py features.jsonl -o predictions.jsonl
+    python score.py features.csv --chunk-size 50000 > predictions.jsonl
+'''
+
+import argparse
+import sys
+import time
+
+from app import bulk
+from app.validation import DEFAULT_MARGIN, Validator
+from app.forest import find_model, load_model
+
+CLASS_NAMES = ('setosa', 'versicolor', 'virginica')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('input', help='JSONL ({"features": [...]} or [...] per line) or CSV file; - for stdin')
+    parser.add_argument('-o', '--output', default='-', help='NDJSON output file (default: stdout)')
+    parser.add_argument('--format', choices=['jsonl', 'csv'], help='input format (default: from the file extension)')
+    parser.add_argument('--model', help='model to use (default: app/model.forest or app/model.joblib)')
+    parser.add_argument('--chunk-size', type=int, default=bulk.DEFAULT_CHUNK_SIZE, help='rows per model call')
+    parser.add_argument('--range-margin', type=float, default=DEFAULT_MARGIN,
+                        help='reject rows beyond the training ranges widened by this fraction; negative disables')
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.input.endswith('.csv') else 'jsonl')
+    model_path = args.model or find_model(['app/model.joblib', 'model.joblib']) or 'app/model.joblib'
+    model = load_model(model_path)
+    validator = Validator.for_artifact(model_path, args.range_margin)
+
+    source = sys.stdin if args.input == '-' else open(args.input, newline='' if fmt == 'csv' else None)
+    sink = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    start = time.perf_counter()
+    rows = errors = 0
+    try:
+        entries = bulk.read_entries(source, fmt)
+        for results in bulk.score_stream(model.predict, entries, CLASS_NAMES, args.chunk_size, validator):
+            sink.write(bulk.encode_ndjson(results))
+            rows += len(results)
+            errors += sum('error' in result for result in results)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout.buffer:
+            sink.close()
+
+    elapsed = time.perf_counter() - start
+    print('Scored %d rows (%d errors) in %.2fs, %.0f rows/s' % (
+        rows, errors, elapsed, rows / elapsed if elapsed else 0.0), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+from sklearn.datasets import load_iris
+from sklearn.ensemble import RandomForestClassifier
+
+from app.forest import CompiledForest
+from app.registry import replace_artifact
+from app.validation import training_ranges
+
+
+@pytest.fixture(scope='session')
+def model_path(tmp_path_factory):
+    """A small compiled forest with its training ranges, as save_model.py writes them."""
+    X, y = load_iris(return_X_y=True)
+    model = RandomForestClassifier(n_estimators=10, random_state=0).fit(X, y)
+    path = str(tmp_path_factory.mktemp('model') / 'model.forest')
+    replace_artifact(CompiledForest.from_model(model), path, schema=training_ranges(X))
+    return path
+
+
+@pytest.fixture(scope='session')
+def client(model_path):
+    """The FastAPI app serving ``model_path``, in process."""
+    from fastapi.testclient import TestClient
+
+    # app.server loads its model at import
+    os.environ['MODEL_PATH'] = model_path
+    from app import server
+
+    with TestClient(server.app) as client:
+        yield client
@@ -0,0 +1,144 @@
+import asyncio
+
+import httpx
+import pytest
+from starlette.responses import JSONResponse
+
+from app.admission import DEADLINE_HEADER, AdmissionController, AdmissionMiddleware
+
+
+def serve(controller):
+    """An admission-controlled app whose requests are held until ``release`` is set."""
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await release.wait()
+        await JSONResponse({'ok': True})(scope, receive, send)
+
+    middleware = AdmissionMiddleware(app, controller, ['/predict'])
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=middleware), base_url='http://test'), release
+
+
+async def wait_until(condition, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, 'condition not reached'
+        await asyncio.sleep(0.001)
+
+
+def test_full_queue_is_rejected_with_429():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=5.0)
+        client, release = serve(controller)
+        async with client:
+            held = asyncio.create_task(client.post('/predict'))
+            queued = asyncio.create_task(client.post('/predict'))
+            await wait_until(lambda: controller.queue_depth == 1)
+            rejected = await client.post('/predict')
+            release.set()
+            return controller, rejected, await held, await queued
+
+    controller, rejected, held, queued = asyncio.run(scenario())
+    assert rejected.status_code == 429
+    assert rejected.json() == {'detail': 'Request not admitted: queue full'}
+    assert int(rejected.headers['Retry-After']) >= 1
+    assert (held.status_code, queued.status_code) == (200, 200)
+    assert controller.rejected['queue_full'] == 1
+    assert controller.stats()['in_flight'] == 0
+
+
+def test_queue_timeout_is_rejected_with_503_and_retry_after():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=0.05)
+        client, release = serve(controller)
+        async with client:
+            held = asyncio.create_task(client.post('/predict'))
+            await wait_until(lambda: controller.stats()['in_flight'] == 1)
+            timed_out = await client.post('/predict')
+            release.set()
+            await held
+            return controller, timed_out
+
+    controller, timed_out = asyncio.run(scenario())
+    assert timed_out.status_code == 503
+    assert timed_out.json() == {'detail': 'Request not admitted: queue timeout'}
+    assert int(timed_out.headers['Retry-After']) >= 1
+    assert controller.queue_depth == 0
+
+
+@pytest.mark.parametrize('budget_ms', ['0', '20'])
+def test_expired_client_deadline_is_rejected_with_503_without_retry_after(budget_ms):
+    # '0' has expired on arrival; '20' expires while queued, before the queue timeout
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=5.0)
+        client, release = serve(controller)
+        async with client:
+            held = asyncio.create_task(client.post('/predict'))
+            await wait_until(lambda: controller.stats()['in_flight'] == 1)
+            expired = await client.post('/predict', headers={DEADLINE_HEADER: budget_ms})
+            release.set()
+            await held
+            return controller, expired
+
+    controller, expired = asyncio.run(scenario())
+    assert expired.status_code == 503
+    assert expired.json() == {'detail': 'Request not admitted: deadline'}
+    assert 'Retry-After' not in expired.headers
+    assert controller.rejected['deadline'] == 1
+
+
+@pytest.mark.parametrize('budget_ms', ['soon', '', 'nan', 'inf', '-inf', '-5'])
+def test_malformed_deadline_header_is_rejected_with_400(budget_ms):
+    async def scenario():
+        controller = AdmissionController()
+        client, release = serve(controller)
+        release.set()
+        async with client:
+            return controller, await client.post('/predict', headers={DEADLINE_HEADER: budget_ms})
+
+    controller, response = asyncio.run(scenario())
+    assert response.status_code == 400
+    assert DEADLINE_HEADER in response.json()['detail']
+    assert controller.admitted == 0
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=5.0)
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await wait_until(lambda: controller.queue_depth == 1)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert controller.queue_depth == 0
+        # The freed slot is not handed to the cancelled waiter
+        controller.release(0.01)
+        assert controller.stats()['in_flight'] == 0
+        assert await controller.acquire() == 0.0
+
+    asyncio.run(scenario())
+
+
+def test_slot_handed_to_a_waiter_cancelled_meanwhile_is_not_leaked():
+    async def scenario():
+        controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=5.0)
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire())
+        await wait_until(lambda: controller.queue_depth == 1)
+        # Handed over, then cancelled before the waiter got to run
+        controller.release(0.01)
+        waiter.cancel()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            pass
+        else:
+            # asyncio.wait_for may deliver the slot despite the cancellation:
+            # the caller then owns it, as after any successful acquire
+            controller.release(0.01)
+        assert controller.stats()['in_flight'] == 0
+        assert controller.queue_depth == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,72 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import numpy as np
+
+from app import bulk
+from app.validation import Validator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CLASS_NAMES = ('setosa', 'versicolor', 'virginica')
+
+# An integer no float can hold
+HUGE = '1' * 400
+
+NDJSON = '\n'.join([
+    '[5.1, 3.5, 1.4, 0.2]',
+    '[%s, 1, 2, 3]' % HUGE,
+    '{"features": [6.7, 3.0, 5.2, 2.3]}',
+    '{"features": [1e39, 3.5, 1.4, 0.2]}',
+]) + '\n'
+
+EXPECTED = [
+    {'predicted_class': 'setosa'},
+    {'error': 'features must fit in float32'},
+    {'predicted_class': 'virginica'},
+    {'error': 'sepal_length must be finite'},
+]
+
+
+def predict(features):
+    # Class 0 for short petals, else 2: enough to check rows stay in order
+    return np.where(features[:, 2] < 2.5, 0, 2)
+
+
+def test_every_ndjson_row_yields_one_result():
+    entries = bulk.read_entries(io.StringIO(NDJSON), 'jsonl')
+    [results] = bulk.score_stream(predict, entries, CLASS_NAMES, chunk_size=100, validator=Validator())
+    assert results == EXPECTED
+
+
+def test_stream_answers_an_oversized_integer_row(client):
+    response = client.post('/predict/stream', content=NDJSON, headers={'Content-Type': 'application/x-ndjson'})
+    assert response.status_code == 200
+    assert [json.loads(line) for line in response.text.splitlines()] == EXPECTED
+
+
+def test_score_cli_answers_an_oversized_integer_row(model_path, tmp_path):
+    source = tmp_path / 'features.jsonl'
+    source.write_text(NDJSON)
+    completed = subprocess.run(
+        [sys.executable, os.path.join(ROOT, 'score.py'), str(source), '--model', model_path],
+        capture_output=True, text=True, cwd=str(tmp_path), env=dict(os.environ, PYTHONPATH=ROOT),
+    )
+    assert completed.returncode == 0, completed.stderr
+    assert [json.loads(line) for line in completed.stdout.splitlines()] == EXPECTED
+    assert 'Scored 4 rows (2 errors)' in completed.stderr
+
+
+def test_chunk_rejects_the_rows_predict_batch_rejects():
+    rows = [
+        [5.1, 3.5, 1.4, 0.2], [True, 3.5, 1.4, 0.2], [1, 2, 3], [5.1, '3.5', 1.4, 0.2],
+        [int(HUGE), 1, 2, 3], [float('nan'), 3.5, 1.4, 0.2], [6.7, 3.0, 5.2, 2.3],
+    ]
+    validator = Validator()
+    results = bulk.score_chunk(predict, rows, CLASS_NAMES, validator)
+    errors = {error['index']: error['error'] for error in validator.validate(rows).errors}
+    assert {i: result['error'] for i, result in enumerate(results) if 'error' in result} == errors
+    assert sorted(errors) == [1, 2, 3, 4, 5]
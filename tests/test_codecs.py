@@ -0,0 +1,29 @@
+import pytest
+
+from app import codecs
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, codecs.JSON),
+    ('', codecs.JSON),
+    ('*/*', codecs.JSON),
+    ('application/json', codecs.JSON),
+    ('application/octet-stream', codecs.OCTET),
+    ('application/x-msgpack', codecs.MSGPACK),
+    ('application/msgpack;q=0, application/json', codecs.JSON),
+    ('application/x-msgpack; q=0.0, */*', codecs.JSON),
+    ('application/json;q=0.5, application/octet-stream', codecs.OCTET),
+    ('application/octet-stream;q=0.4, application/x-msgpack;q=0.9', codecs.MSGPACK),
+    ('application/x-msgpack, application/octet-stream', codecs.MSGPACK),
+    ('application/octet-stream;q=abc, application/json', codecs.JSON),
+    ('text/html', codecs.JSON),
+])
+def test_accepts_weighs_q_values(header, expected):
+    if expected == codecs.MSGPACK and codecs.msgpack is None:
+        pytest.skip('msgpack is not installed')
+    assert codecs.accepts(header) == expected
+
+
+def test_accepts_ignores_msgpack_when_not_installed(monkeypatch):
+    monkeypatch.setattr(codecs, 'msgpack', None)
+    assert codecs.accepts('application/x-msgpack, application/octet-stream;q=0.1') == codecs.OCTET
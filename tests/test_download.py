@@ -0,0 +1,136 @@
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import threading
+import time
+
+import pytest
+
+from app import download
+
+BODY = bytes(range(256)) * 4096
+ETAG = '"v1"'
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Serves ``server.body`` with an ETag, Range/If-Range and If-None-Match."""
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.delay)
+        body, etag = server.body, server.etag
+        if self.headers.get('If-None-Match') == etag:
+            self._record(304)
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        start = 0
+        if self.headers.get('Range') and self.headers.get('If-Range', etag) == etag:
+            start = int(self.headers['Range'][len('bytes='):-len('-')])
+        self._record(206 if start else 200)
+        self.send_response(206 if start else 200)
+        if start:
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(body) - 1, len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+    def _record(self, status):
+        self.server.requests.append((status, dict(self.headers)))
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.body, server.etag, server.delay, server.requests = BODY, ETAG, 0.0, []
+    server.url = 'http://127.0.0.1:%d/model.joblib' % server.server_address[1]
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url_base(cache_dir, url):
+    return os.path.join(cache_dir, 'url-' + hashlib.sha256(url.encode()).hexdigest()[:16])
+
+
+def test_fetch_downloads_and_names_by_sha256(server, tmp_path):
+    digest = hashlib.sha256(BODY).hexdigest()
+    path = download.fetch(server.url, str(tmp_path), sha256=digest.upper(), suffix='.joblib')
+    assert path == os.path.join(str(tmp_path), digest + '.joblib')
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+    # Pinned and cached: the network is not touched again
+    assert download.fetch(server.url, str(tmp_path), sha256=digest, suffix='.joblib') == path
+    assert [status for status, _ in server.requests] == [200]
+
+
+def test_sha256_mismatch_leaves_nothing_in_the_cache(server, tmp_path):
+    with pytest.raises(download.DownloadError, match='sha256 mismatch'):
+        download.fetch(server.url, str(tmp_path), sha256='0' * 64)
+    # Only the lock file remains: no artifact, partial file or metadata
+    assert os.listdir(str(tmp_path)) == [os.path.basename(url_base(str(tmp_path), server.url)) + '.lock']
+
+
+def test_truncated_part_is_resumed_with_range(server, tmp_path):
+    part = url_base(str(tmp_path), server.url) + '.part'
+    with open(part, 'wb') as f:
+        f.write(BODY[:1000])
+    download._write_json(part + '.json', {'url': server.url, 'etag': ETAG})
+
+    path = download.fetch(server.url, str(tmp_path))
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+    [(status, headers)] = server.requests
+    assert status == 206
+    assert headers['Range'] == 'bytes=1000-'
+    assert headers['If-Range'] == ETAG
+    assert not os.path.exists(part)
+
+
+def test_changed_resource_restarts_a_partial_download(server, tmp_path):
+    part = url_base(str(tmp_path), server.url) + '.part'
+    with open(part, 'wb') as f:
+        f.write(b'stale bytes')
+    download._write_json(part + '.json', {'url': server.url, 'etag': '"v0"'})
+
+    path = download.fetch(server.url, str(tmp_path))
+    with open(path, 'rb') as f:
+        assert f.read() == BODY
+    assert [status for status, _ in server.requests] == [200]
+
+
+def test_unpinned_artifact_is_revalidated_with_if_none_match(server, tmp_path):
+    first = download.fetch(server.url, str(tmp_path))
+    assert download.fetch(server.url, str(tmp_path)) == first
+    assert [status for status, _ in server.requests] == [200, 304]
+    assert server.requests[1][1]['If-None-Match'] == ETAG
+
+    # A new version is downloaded beside the old one
+    server.body, server.etag = BODY[::-1], '"v2"'
+    second = download.fetch(server.url, str(tmp_path))
+    assert second != first
+    assert os.path.basename(second) == hashlib.sha256(BODY[::-1]).hexdigest()
+
+
+def test_concurrent_fetches_share_one_download(server, tmp_path):
+    digest = hashlib.sha256(BODY).hexdigest()
+    server.delay = 0.3
+    paths = []
+    threads = [
+        threading.Thread(target=lambda: paths.append(download.fetch(server.url, str(tmp_path), sha256=digest)))
+        for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert paths == [os.path.join(str(tmp_path), digest)] * 2
+    # The second caller waited on the lock, then found the finished artifact
+    assert [status for status, _ in server.requests] == [200]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from sklearn.datasets import load_iris
+from sklearn.ensemble import RandomForestClassifier
+
+from app.forest import CHUNK_ROWS, CompiledForest, load_model
+
+
+@pytest.fixture(scope='module')
+def model():
+    X, y = load_iris(return_X_y=True)
+    return RandomForestClassifier(n_estimators=25, random_state=0).fit(X, y)
+
+
+def random_rows(model, n, seed=0):
+    """Rows over the training ranges, with some exactly on split thresholds."""
+    rng = np.random.default_rng(seed)
+    X = rng.uniform([4.0, 2.0, 1.0, 0.1], [8.0, 4.5, 7.0, 2.5], size=(n, 4)).astype(np.float32)
+    tree = model.estimators_[0].tree_
+    splits = np.flatnonzero(tree.children_left != -1)
+    for i in range(0, n, 7):
+        node = splits[i % len(splits)]
+        X[i, tree.feature[node]] = tree.threshold[node]
+    return X
+
+
+@pytest.mark.parametrize('n_rows', [1, 2, CHUNK_ROWS - 1, CHUNK_ROWS, CHUNK_ROWS + 1, 2 * CHUNK_ROWS + 3])
+def test_matches_sklearn(model, n_rows):
+    forest = CompiledForest.from_model(model)
+    X = random_rows(model, n_rows, seed=n_rows)
+    np.testing.assert_array_equal(forest.predict_proba(X), model.predict_proba(X))
+    np.testing.assert_array_equal(forest.predict(X), model.predict(X))
+
+
+def test_load_memory_maps_saved_artifact(model, tmp_path):
+    path = str(tmp_path / 'model.forest')
+    CompiledForest.from_model(model).save(path)
+    loaded = load_model(path)
+    assert isinstance(loaded, CompiledForest)
+    assert isinstance(loaded.threshold, np.memmap)
+    X = random_rows(model, CHUNK_ROWS + 5)
+    np.testing.assert_array_equal(loaded.predict_proba(X), model.predict_proba(X))
+    np.testing.assert_array_equal(loaded.classes_, model.classes_)
+    assert loaded.n_features_in_ == model.n_features_in_
+
+
+def test_rejects_wrong_shape(model):
+    forest = CompiledForest.from_model(model)
+    with pytest.raises(ValueError):
+        forest.predict_proba(np.zeros((3, 5), dtype=np.float32))
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from app.validation import Validator
+
+MIXED_BOOL_ROWS = [[True, 3.5, 1.4, 0.2], [5.1, False, 1.4, 0.2], [5.0, 3.0, 1, True]]
+
+
+@pytest.mark.parametrize('row', MIXED_BOOL_ROWS)
+def test_to_array_rejects_bools_among_numbers(row):
+    # np.asarray turns these rows into floats: the fast path must not take them
+    features, errors = Validator().to_array([[5.1, 3.5, 1.4, 0.2], row])
+    assert list(errors) == [1]
+    assert errors[1].endswith('must be a number')
+
+
+def test_to_array_keeps_zeros_and_ones():
+    rows = [[1, 0, 1.0, 0.0], [5.1, 3.5, 1.4, 0.2]]
+    features, errors = Validator().to_array(rows)
+    assert errors == {}
+    np.testing.assert_array_equal(features, np.asarray(rows, dtype=np.float32))
+
+
+def test_to_array_reports_overflow_per_row():
+    features, errors = Validator().to_array([[5.1, 3.5, 1.4, 0.2], [10 ** 400, 1, 2, 3]])
+    assert errors == {1: 'features must fit in float32'}
+
+
+@pytest.mark.parametrize('row', MIXED_BOOL_ROWS)
+def test_predict_rejects_bools_among_numbers(client, row):
+    response = client.post('/predict', json={'features': row})
+    assert response.status_code == 422
+    assert 'must be a number' in response.json()['detail']
+
+
+def test_predict_batch_rejects_bools_among_numbers(client):
+    rows = [[5.1, 3.5, 1.4, 0.2]] + MIXED_BOOL_ROWS
+    response = client.post('/predict/batch', json={'instances': rows})
+    assert response.status_code == 200
+    body = response.json()
+    assert body['predicted_classes'][0] == 'setosa'
+    assert body['predicted_classes'][1:] == [None, None, None]
+    assert [error['index'] for error in body['errors']] == [1, 2, 3]